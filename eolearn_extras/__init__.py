@@ -3,3 +3,9 @@ import eolearn_extras.bathybase as bathybase
 import eolearn_extras.raster as raster
 import eolearn_extras.visualization as visualization
 import eolearn_extras.ml_util as ml_util
+import eolearn_extras.tiling as tiling
+import eolearn_extras.cache as cache
+import eolearn_extras.catalog as catalog
+import eolearn_extras.ingest as ingest
+import eolearn_extras.pipeline as pipeline
+import eolearn_extras.storage as storage
@@ -0,0 +1,152 @@
+import os
+import shutil
+import hashlib
+
+from eolearn.core import EOPatch, EOTask, OverwritePermission
+
+
+def fingerprint_path(path):
+    # SAFE archives and Acolite products are folders - every contained file
+    # contributes its relative path, size and modification time
+    path = os.path.abspath(path)
+    if os.path.isfile(path):
+        stat = os.stat(path)
+        return [(os.path.basename(path), stat.st_size, stat.st_mtime_ns)]
+
+    entries = []
+    for root, _, files in os.walk(path):
+        for file_name in files:
+            file_path = os.path.join(root, file_name)
+            stat = os.stat(file_path)
+            entries.append(
+                (
+                    os.path.relpath(file_path, path).replace(os.sep, "/"),
+                    stat.st_size,
+                    stat.st_mtime_ns,
+                )
+            )
+
+    return sorted(entries)
+
+
+def get_task_settings(task: EOTask, ignored_settings=()):
+    settings = {
+        name: value
+        for (name, value) in vars(task).items()
+        if not name.startswith("_") and name not in ignored_settings
+    }
+    settings["task"] = type(task).__name__
+
+    return settings
+
+
+def compute_cache_key(source_path, settings):
+    key_hash = hashlib.sha256()
+    key_hash.update(repr(os.path.abspath(source_path)).encode("utf-8"))
+    key_hash.update(repr(fingerprint_path(source_path)).encode("utf-8"))
+    key_hash.update(repr(sorted(settings.items())).encode("utf-8"))
+
+    return key_hash.hexdigest()
+
+
+def get_directory_size(path):
+    return sum(
+        os.path.getsize(os.path.join(root, file_name))
+        for root, _, files in os.walk(path)
+        for file_name in files
+    )
+
+
+class EOPatchCache:
+    def __init__(self, cache_dir, max_size_bytes=50 * 1024 ** 3):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_size_bytes = max_size_bytes
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def get(self, key):
+        entry_path = self._entry_path(key)
+        if not os.path.isdir(entry_path):
+            return None
+
+        eopatch = EOPatch.load(entry_path)
+        # the modification time of an entry doubles as its last access time
+        os.utime(entry_path)
+
+        return eopatch
+
+    def put(self, key, eopatch: EOPatch):
+        entry_path = self._entry_path(key)
+        # saving into a temporary folder first makes sure no half written
+        # entry is ever picked up by a concurrent reader
+        tmp_path = f"{entry_path}.tmp-{os.getpid()}"
+        eopatch.save(
+            tmp_path, overwrite_permission=OverwritePermission.OVERWRITE_PATCH
+        )
+        if os.path.isdir(entry_path):
+            shutil.rmtree(entry_path)
+        os.replace(tmp_path, entry_path)
+
+        self.evict(keep=key)
+
+    def evict(self, keep=None):
+        entries = [
+            (os.path.getmtime(self._entry_path(key)), key)
+            for key in os.listdir(self.cache_dir)
+            if ".tmp-" not in key and os.path.isdir(self._entry_path(key))
+        ]
+        sizes = {
+            key: get_directory_size(self._entry_path(key))
+            for (_, key) in entries
+        }
+
+        total_size = sum(sizes.values())
+        # least recently used entries go first
+        for (_, key) in sorted(entries):
+            if total_size <= self.max_size_bytes:
+                break
+            if key == keep:
+                continue
+
+            shutil.rmtree(self._entry_path(key), ignore_errors=True)
+            total_size -= sizes[key]
+
+    def clear(self):
+        for key in os.listdir(self.cache_dir):
+            shutil.rmtree(self._entry_path(key), ignore_errors=True)
+
+
+class CachedReadTask(EOTask):
+    # settings which do not influence the produced EOPatch
+    ignored_settings = (
+        "log_callback",
+        "max_workers",
+        "executor_type",
+        "lazy",
+        "chunks",
+    )
+
+    def __init__(self, read_task: EOTask, cache: EOPatchCache):
+        self.read_task = read_task
+        self.cache = cache
+
+    def get_cache_key(self, source_path):
+        settings = get_task_settings(self.read_task, self.ignored_settings)
+
+        return compute_cache_key(source_path, settings)
+
+    def execute(self, *args, **kwargs):
+        # workflows pass the source path under the argument name of the
+        # wrapped task, e.g. sentinel_archive_path or acolite_product_folder
+        (source_path,) = list(args) + list(kwargs.values())
+        key = self.get_cache_key(source_path)
+
+        eopatch = self.cache.get(key)
+        if eopatch is None:
+            eopatch = self.read_task.execute(*args, **kwargs)
+            self.cache.put(key, eopatch)
+
+        return eopatch
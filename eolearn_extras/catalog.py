@@ -0,0 +1,381 @@
+import os
+import re
+import glob
+import sqlite3
+import datetime
+from contextlib import contextmanager
+import xml.etree.ElementTree as ET
+from collections import namedtuple
+
+import rasterio as rio
+from eolearn.core import EOTask
+from sentinelhub import BBox, CRS
+
+from eolearn_extras.io import (
+    extract_meta_from_path,
+    construct_time_series_eopatch_from_sentinel_archives,
+)
+
+
+Scene = namedtuple(
+    "Scene",
+    [
+        "path",
+        "mission",
+        "level",
+        "acq_time",
+        "tile",
+        "crs",
+        "min_x",
+        "min_y",
+        "max_x",
+        "max_y",
+        "cloud_fraction",
+    ],
+)
+
+_time_format = "%Y-%m-%dT%H:%M:%S"
+
+_schema = """
+CREATE TABLE IF NOT EXISTS scenes (
+    path TEXT PRIMARY KEY,
+    mission TEXT,
+    level TEXT,
+    acq_time TEXT NOT NULL,
+    tile TEXT,
+    crs INTEGER,
+    min_x REAL,
+    min_y REAL,
+    max_x REAL,
+    max_y REAL,
+    cloud_fraction REAL
+);
+CREATE INDEX IF NOT EXISTS scenes_level_time ON scenes (level, acq_time);
+"""
+
+default_archive_patterns = ("*.SAFE", "*ACOLITE*")
+
+
+def extract_tile_from_path(product_path):
+    result = re.search(r"_(T\d{2}[A-Z]{3})_", os.path.basename(product_path))
+    return None if result is None else result.group(1)
+
+
+def extract_acolite_meta_from_path(acolite_folder_path):
+    # same pattern as sdb_utils.acolite, e.g. S2B_MSI_20210502T150719_ACOLITE
+    acolite_date_pattern = r"(\d{4})(\d{2})(\d{2})T(\d{2})(\d{2})(\d{2})"
+    result = re.search(
+        acolite_date_pattern, os.path.basename(acolite_folder_path)
+    )
+    if result is None:
+        raise ValueError(
+            f"Could not extract acquisition time from {acolite_folder_path}"
+        )
+
+    mission = os.path.basename(acolite_folder_path).split("_")[0]
+    acq_time = datetime.datetime(*[int(x) for x in result.groups()])
+
+    return mission, "ACOLITE", acq_time
+
+
+def read_product_footprint(product_path):
+    # all bands of a product share the tile extent, so the first band found
+    # is enough to get the crs and bounds
+    band_paths = sorted(
+        glob.glob(f"{product_path}/**/*.jp2", recursive=True)
+        + glob.glob(f"{product_path}/**/*.tif", recursive=True)
+    )
+    for band_path in band_paths:
+        with rio.open(band_path) as src:
+            if src.crs is None:
+                continue
+
+            return src.crs.to_epsg(), tuple(src.bounds)
+
+    return None, (None, None, None, None)
+
+
+def read_cloud_fraction(product_path):
+    for metadata_path in glob.glob(f"{product_path}/MTD_MSI*.xml"):
+        for element in ET.parse(metadata_path).iter():
+            if element.tag.endswith("Cloud_Coverage_Assessment"):
+                return float(element.text) / 100
+
+    return None
+
+
+def get_scene_from_path(product_path):
+    product_path = os.path.abspath(product_path)
+    if "ACOLITE" in os.path.basename(product_path):
+        mission, level, acq_time = extract_acolite_meta_from_path(product_path)
+    else:
+        mission, level, acq_time = extract_meta_from_path(product_path)
+
+    crs, bounds = read_product_footprint(product_path)
+
+    return Scene(
+        product_path,
+        mission,
+        level,
+        acq_time,
+        extract_tile_from_path(product_path),
+        crs,
+        *bounds,
+        read_cloud_fraction(product_path),
+    )
+
+
+def get_scene_coverage(scene: Scene, bbox: BBox):
+    # fraction of the bbox area which is covered by the scene footprint
+    if scene.crs is None:
+        return 0.0
+
+    if bbox.crs != CRS(scene.crs):
+        bbox = bbox.transform(CRS(scene.crs))
+
+    overlap_width = min(scene.max_x, bbox.max_x) - max(
+        scene.min_x, bbox.min_x
+    )
+    overlap_height = min(scene.max_y, bbox.max_y) - max(
+        scene.min_y, bbox.min_y
+    )
+    if overlap_width <= 0 or overlap_height <= 0:
+        return 0.0
+
+    bbox_area = (bbox.max_x - bbox.min_x) * (bbox.max_y - bbox.min_y)
+
+    return min(1.0, overlap_width * overlap_height / bbox_area)
+
+
+def _row_to_scene(row):
+    row = list(row)
+    row[3] = datetime.datetime.strptime(row[3], _time_format)
+
+    return Scene(*row)
+
+
+class SceneCatalog:
+    def __init__(self, db_path):
+        # only the database path is kept so that the catalog can be pickled
+        # into process pools, every operation opens its own connection
+        self.db_path = os.path.abspath(db_path)
+
+        with self._connect() as connection:
+            connection.executescript(_schema)
+
+    @contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self.db_path)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def __len__(self):
+        with self._connect() as connection:
+            (count,) = connection.execute(
+                "SELECT COUNT(*) FROM scenes"
+            ).fetchone()
+
+        return count
+
+    def __contains__(self, product_path):
+        return self.get_scene(product_path) is not None
+
+    def add_scenes(self, scenes):
+        with self._connect() as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO scenes VALUES "
+                "(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    scene._replace(
+                        acq_time=scene.acq_time.strftime(_time_format)
+                    )
+                    for scene in scenes
+                ],
+            )
+
+    def remove_scenes(self, product_paths):
+        with self._connect() as connection:
+            connection.executemany(
+                "DELETE FROM scenes WHERE path = ?",
+                [(os.path.abspath(path),) for path in product_paths],
+            )
+
+    def index_directory(
+        self, archive_root, patterns=default_archive_patterns, refresh=False
+    ):
+        # already known products are skipped unless refresh is set, so
+        # re-indexing only opens the newly added products
+        product_paths = sorted(
+            os.path.abspath(path)
+            for pattern in patterns
+            for path in glob.glob(os.path.join(archive_root, pattern))
+        )
+        if not refresh:
+            product_paths = [
+                path for path in product_paths if path not in self
+            ]
+
+        scenes = [get_scene_from_path(path) for path in product_paths]
+        self.add_scenes(scenes)
+
+        return scenes
+
+    def get_scene(self, product_path):
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT * FROM scenes WHERE path = ?",
+                (os.path.abspath(product_path),),
+            ).fetchone()
+
+        return None if row is None else _row_to_scene(row)
+
+    def _scenes_from_query(self, query, parameters, bbox, min_coverage):
+        # rows are streamed from the (level, acq_time) index, the coverage
+        # filter only needs to look at rows until a match is found
+        with self._connect() as connection:
+            for row in connection.execute(query, parameters):
+                scene = _row_to_scene(row)
+                if bbox is None:
+                    yield scene
+                    continue
+
+                coverage = get_scene_coverage(scene, bbox)
+                if coverage > 0 and coverage >= min_coverage:
+                    yield scene
+
+    def find_scenes(
+        self,
+        level,
+        start_time=None,
+        end_time=None,
+        bbox: BBox = None,
+        min_coverage=0.0,
+        max_cloud_fraction=None,
+    ):
+        query = "SELECT * FROM scenes WHERE level = ?"
+        parameters = [level]
+        if start_time is not None:
+            query += " AND acq_time >= ?"
+            parameters.append(start_time.strftime(_time_format))
+        if end_time is not None:
+            query += " AND acq_time <= ?"
+            parameters.append(end_time.strftime(_time_format))
+        if max_cloud_fraction is not None:
+            query += " AND (cloud_fraction IS NULL OR cloud_fraction <= ?)"
+            parameters.append(max_cloud_fraction)
+        query += " ORDER BY acq_time"
+
+        return list(
+            self._scenes_from_query(query, parameters, bbox, min_coverage)
+        )
+
+    def find_nearest_scene(
+        self,
+        level,
+        acq_time: datetime.datetime,
+        max_delta: datetime.timedelta = None,
+        bbox: BBox = None,
+        min_coverage=0.0,
+    ):
+        encoded_time = acq_time.strftime(_time_format)
+        # the closest scene is either the first one at or after the
+        # requested time or the last one before it
+        candidates = []
+        for comparison, order in ((">=", "ASC"), ("<", "DESC")):
+            query = (
+                "SELECT * FROM scenes WHERE level = ? "
+                f"AND acq_time {comparison} ? ORDER BY acq_time {order}"
+            )
+            scene = next(
+                self._scenes_from_query(
+                    query, (level, encoded_time), bbox, min_coverage
+                ),
+                None,
+            )
+            if scene is not None:
+                candidates.append(scene)
+
+        candidates = [
+            scene for scene in candidates
+            if max_delta is None or abs(scene.acq_time - acq_time) <= max_delta
+        ]
+        if len(candidates) < 1:
+            raise ValueError(
+                f"Could not find {level} product for date "
+                f"{acq_time.isoformat()}"
+            )
+
+        return min(
+            candidates, key=lambda scene: abs(scene.acq_time - acq_time)
+        )
+
+
+def select_best_scene_per_acquisition(scenes, bbox: BBox = None):
+    # several tiles can be acquired at the same time, only the one with the
+    # best coverage of the bbox is kept for every timestamp
+    best_scenes = {}
+    for scene in scenes:
+        coverage = 1.0 if bbox is None else get_scene_coverage(scene, bbox)
+        best = best_scenes.get(scene.acq_time)
+        if best is None or coverage > best[0]:
+            best_scenes[scene.acq_time] = (coverage, scene)
+
+    return [
+        scene for (_, scene) in sorted(
+            best_scenes.values(), key=lambda entry: entry[1].acq_time
+        )
+    ]
+
+
+class IngestSceneTimeSeriesTask(EOTask):
+    def __init__(
+        self,
+        catalog: SceneCatalog,
+        level,
+        bbox: BBox,
+        target_shape=None,
+        target_resolution=10,
+        min_coverage=1.0,
+        max_cloud_fraction=None,
+        log_callback=None,
+        **read_kwargs,
+    ):
+        self.catalog = catalog
+        self.level = level
+        self.bbox = bbox
+        self.target_shape = target_shape
+        self.target_resolution = target_resolution
+        self.min_coverage = min_coverage
+        self.max_cloud_fraction = max_cloud_fraction
+        self.log_callback = log_callback
+        self.read_kwargs = read_kwargs
+
+    def execute(self, start_time=None, end_time=None):
+        scenes = select_best_scene_per_acquisition(
+            self.catalog.find_scenes(
+                self.level,
+                start_time=start_time,
+                end_time=end_time,
+                bbox=self.bbox,
+                min_coverage=self.min_coverage,
+                max_cloud_fraction=self.max_cloud_fraction,
+            ),
+            bbox=self.bbox,
+        )
+        if len(scenes) < 1:
+            raise ValueError(f"No {self.level} scenes found in the catalog")
+
+        if self.log_callback:
+            self.log_callback(f"Ingesting {len(scenes)} {self.level} scenes.")
+
+        return construct_time_series_eopatch_from_sentinel_archives(
+            [scene.path for scene in scenes],
+            bbox=self.bbox,
+            target_shape=self.target_shape,
+            target_resolution=self.target_resolution,
+            log_callback=self.log_callback,
+            **self.read_kwargs,
+        )
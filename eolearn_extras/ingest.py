@@ -0,0 +1,299 @@
+import os
+import json
+import shutil
+import hashlib
+
+import numpy as np
+from eolearn.core import EOPatch, EOTask, FeatureType, OverwritePermission
+
+from eolearn_extras.cache import (
+    CachedReadTask,
+    fingerprint_path,
+    get_task_settings,
+)
+
+
+def compute_settings_hash(settings):
+    return hashlib.sha256(
+        repr(sorted(settings.items())).encode("utf-8")
+    ).hexdigest()
+
+
+def get_manifest_entry(source_path, settings_hash):
+    fingerprint = fingerprint_path(source_path)
+
+    return {
+        "size": sum(size for (_, size, _) in fingerprint),
+        "mtime": max((mtime for (_, _, mtime) in fingerprint), default=0),
+        "settings_hash": settings_hash,
+    }
+
+
+class IngestManifest:
+    def __init__(self, manifest_path):
+        self.manifest_path = os.path.abspath(manifest_path)
+        self.entries = {}
+
+        if os.path.isfile(self.manifest_path):
+            with open(self.manifest_path) as f:
+                self.entries = json.load(f)
+
+    def __contains__(self, source_path):
+        return os.path.abspath(source_path) in self.entries
+
+    def is_current(self, source_path, settings_hash):
+        stored_entry = self.entries.get(os.path.abspath(source_path))
+
+        return stored_entry is not None and all(
+            stored_entry.get(key) == value
+            for (key, value) in get_manifest_entry(
+                source_path, settings_hash
+            ).items()
+        )
+
+    def update(self, source_path, settings_hash, **extra_info):
+        self.entries[os.path.abspath(source_path)] = dict(
+            get_manifest_entry(source_path, settings_hash), **extra_info
+        )
+        self.save()
+
+    def save(self):
+        # the manifest is replaced atomically so an interrupted run never
+        # leaves a truncated manifest behind
+        tmp_path = f"{self.manifest_path}.tmp-{os.getpid()}"
+        with open(tmp_path, "w") as f:
+            json.dump(self.entries, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.manifest_path)
+
+
+def concatenate_eopatches(eopatches):
+    # temporal features of all EOPatches are joined in one pass and sorted by
+    # time, of equal timestamps the one of the later EOPatch is kept - as are
+    # its timeless features and meta info
+    eopatches = list(eopatches)
+    if len(eopatches) < 1:
+        raise ValueError("Need at least one EOPatch to concatenate")
+
+    bbox = eopatches[0].bbox
+    if any(eopatch.bbox != bbox for eopatch in eopatches):
+        raise ValueError("Can only concatenate EOPatches with the same bbox")
+
+    frames = {}
+    for patch_index, eopatch in enumerate(eopatches):
+        for time_index, timestamp in enumerate(eopatch.timestamp):
+            frames[timestamp] = (patch_index, time_index)
+    timestamps = sorted(frames)
+
+    result = EOPatch()
+    result.bbox = bbox
+    result.timestamp = timestamps
+
+    for feature_type in FeatureType:
+        if not feature_type.is_raster():
+            continue
+
+        feature_names = set().union(
+            *[set(eopatch[feature_type]) for eopatch in eopatches]
+        )
+        for feature_name in feature_names:
+            feature = (feature_type, feature_name)
+            if not feature_type.is_temporal():
+                result[feature] = [
+                    eopatch[feature] for eopatch in eopatches
+                    if feature in eopatch
+                ][-1]
+                continue
+
+            if any(feature not in eopatch for eopatch in eopatches):
+                raise ValueError(
+                    f"Temporal feature {feature} missing in one of the "
+                    "EOPatches"
+                )
+
+            first_frame = eopatches[0][feature]
+            data = np.empty(
+                (len(timestamps),) + first_frame.shape[1:],
+                dtype=first_frame.dtype,
+            )
+            for index, timestamp in enumerate(timestamps):
+                patch_index, time_index = frames[timestamp]
+                data[index] = eopatches[patch_index][feature][time_index]
+            result[feature] = data
+
+    for eopatch in eopatches:
+        result.meta_info.update(eopatch.meta_info)
+
+    return result
+
+
+def append_eopatch_timestamps(eopatch: EOPatch, new_eopatch: EOPatch):
+    # timestamps of new_eopatch replace equal timestamps of eopatch, e.g.
+    # when a changed archive is ingested again - the result is sorted by time
+    if eopatch is None:
+        return new_eopatch
+
+    return concatenate_eopatches([eopatch, new_eopatch])
+
+
+def get_frame_name(timestamp):
+    return timestamp.strftime("%Y%m%dT%H%M%S")
+
+
+def split_eopatch_timestamps(eopatch: EOPatch):
+    # one single timestamp EOPatch per timestamp, the temporal features are
+    # views of the frames, timeless features are shared by all of them
+    for time_index, timestamp in enumerate(eopatch.timestamp):
+        frame = EOPatch()
+        frame.bbox = eopatch.bbox
+        frame.timestamp = [timestamp]
+        frame.meta_info = dict(eopatch.meta_info)
+        for feature_type in FeatureType:
+            if not feature_type.is_raster():
+                continue
+
+            for feature_name in eopatch[feature_type]:
+                feature = (feature_type, feature_name)
+                frame[feature] = (
+                    eopatch[feature][time_index:time_index + 1]
+                    if feature_type.is_temporal() else eopatch[feature]
+                )
+
+        yield frame
+
+
+def get_frame_paths(output_path):
+    # frame folders are named by their timestamp, so sorted names are in
+    # time order
+    if not os.path.isdir(output_path):
+        return []
+
+    return [
+        os.path.join(output_path, name)
+        for name in sorted(os.listdir(output_path))
+        if os.path.isdir(os.path.join(output_path, name))
+    ]
+
+
+def load_appended_eopatch(output_path, features=...):
+    # merges the frames written by IncrementalIngest with append=True into a
+    # single time series EOPatch
+    frame_paths = get_frame_paths(output_path)
+    if len(frame_paths) < 1:
+        raise ValueError(f"No ingested frames found in {output_path}")
+
+    return concatenate_eopatches(
+        EOPatch.load(frame_path, features=features)
+        for frame_path in frame_paths
+    )
+
+
+class IncrementalIngest:
+    # settings which do not change the ingested EOPatch, see CachedReadTask
+    ignored_settings = CachedReadTask.ignored_settings
+
+    def __init__(
+        self,
+        read_task: EOTask,
+        output_path,
+        append=False,
+        manifest_path=None,
+        log_callback=None,
+    ):
+        # without append every product is saved to its own EOPatch below
+        # output_path, with append every timestamp of a product is saved as
+        # its own frame below output_path - only the frames of new products
+        # are written and load_appended_eopatch merges them on load
+        self.read_task = read_task
+        self.output_path = os.path.abspath(output_path)
+        self.append = append
+        self.log_callback = log_callback
+
+        if manifest_path is None:
+            manifest_path = (
+                f"{self.output_path}.manifest.json" if append
+                else os.path.join(self.output_path, "manifest.json")
+            )
+        manifest_path = os.path.abspath(manifest_path)
+        os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+        self.manifest = IngestManifest(manifest_path)
+        self.settings_hash = compute_settings_hash(
+            get_task_settings(self.read_task, self.ignored_settings)
+        )
+
+    def get_pending_products(self, product_paths):
+        return [
+            path for path in product_paths
+            if not self.manifest.is_current(path, self.settings_hash)
+        ]
+
+    def get_product_output_path(self, product_path):
+        return os.path.join(
+            self.output_path, os.path.basename(os.path.normpath(product_path))
+        )
+
+    def run(self, product_paths):
+        pending_products = self.get_pending_products(product_paths)
+        if self.log_callback:
+            self.log_callback(
+                f"{len(pending_products)} of {len(product_paths)} products "
+                "are new or changed."
+            )
+
+        for index, product_path in enumerate(pending_products):
+            eopatch = self.read_task.execute(product_path)
+
+            if self.append:
+                output_paths = self.save_frames(product_path, eopatch)
+                manifest_info = dict(output_paths=output_paths)
+            else:
+                output_path = self.get_product_output_path(product_path)
+                eopatch.save(
+                    output_path,
+                    overwrite_permission=OverwritePermission.OVERWRITE_PATCH,
+                )
+                manifest_info = dict(output_path=output_path)
+
+            # the manifest is only updated after a successful save, an
+            # interrupted run picks up the remaining products next time
+            self.manifest.update(
+                product_path, self.settings_hash, **manifest_info
+            )
+
+            if self.log_callback:
+                self.log_callback(
+                    f"Ingested {index + 1}/{len(pending_products)} "
+                    f"{os.path.basename(os.path.normpath(product_path))}."
+                )
+
+        return pending_products
+
+    def save_frames(self, product_path, eopatch: EOPatch):
+        # a product which is ingested again replaces its frames, frames of
+        # timestamps it no longer has are removed unless another product
+        # wrote them
+        output_paths = []
+        for frame in split_eopatch_timestamps(eopatch):
+            frame_path = os.path.join(
+                self.output_path, get_frame_name(frame.timestamp[0])
+            )
+            frame.save(
+                frame_path,
+                overwrite_permission=OverwritePermission.OVERWRITE_PATCH,
+            )
+            output_paths.append(frame_path)
+
+        product_path = os.path.abspath(product_path)
+        previous_paths = self.manifest.entries.get(product_path, {}).get(
+            "output_paths", []
+        )
+        other_paths = set(
+            path
+            for (source_path, entry) in self.manifest.entries.items()
+            if source_path != product_path
+            for path in entry.get("output_paths", [])
+        )
+        for frame_path in set(previous_paths) - set(output_paths):
+            if frame_path not in other_paths and os.path.isdir(frame_path):
+                shutil.rmtree(frame_path)
+
+        return output_paths
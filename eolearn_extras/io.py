@@ -2,15 +2,34 @@ from argparse import ArgumentError
 import os
 import glob
 import datetime
+import functools
+import math
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pydoc import resolve
 
+import dask
+import dask.array as da
+import eolearn.core
 import rioxarray as rx
 import rasterio as rio
 import numpy as np
+import xarray as xr
+from packaging.version import Version
 from rasterio.enums import Resampling
+from rasterio.windows import Window
+from rioxarray.rioxarray import affine_to_coords
 from eolearn.core import EOPatch, FeatureType, EOTask
+from eolearn.core.eodata_io import FeatureIO
 from sentinelhub import BBox
 
+from eolearn_extras.raster import (
+    dn_to_reflectance,
+    get_dn_reflectance_factor_key,
+    is_pixel_aligned,
+)
+from eolearn_extras.tiling import get_grid_shape
+
 
 sentinel_2_bands = {
     0: "B01",
@@ -91,19 +110,424 @@ def resolve_l2a_band_paths_highres_first(available_paths, requested_bands):
     return band_paths
 
 
-def construct_eopatch_from_sentinel_archive(
-    sentinel_archive,
+def select_overview_level(src, target_resolution):
+    (source_resolution, _) = src.res
+    # JPEG2000 resolution levels are exposed as overviews - we pick the
+    # coarsest one which is still at least as fine as the target resolution
+    overview_level = None
+    for level, factor in enumerate(src.overviews(1)):
+        if abs(source_resolution) * factor <= target_resolution:
+            overview_level = level
+
+    return overview_level
+
+
+def open_sentinel_band_window(
+    band_path,
+    bbox: BBox,
+    window_margin=2,
+    target_resolution=None,
+    driver="JP2OpenJPEG",
+):
+    with rio.open(band_path, driver=driver) as src:
+        band_epsg = src.crs.to_epsg()
+        # resolutions are only comparable if bbox and band share units
+        overview_level = (
+            select_overview_level(src, target_resolution)
+            if target_resolution is not None and bbox.crs.epsg == band_epsg
+            else None
+        )
+
+    open_kwargs = (
+        {} if overview_level is None else {"OVERVIEW_LEVEL": overview_level}
+    )
+    # opening is lazy - only the selected window gets decoded later on
+    band_da = rx.open_rasterio(band_path, driver=driver, **open_kwargs)
+
+    if bbox.crs.epsg != band_epsg:
+        bbox = bbox.transform(band_epsg)
+
+    bbox_window = rio.windows.from_bounds(
+        *bbox, transform=band_da.rio.transform()
+    )
+    # the margin keeps enough neighbouring pixels around the AOI so that
+    # resampling at the AOI border does not run out of source data
+    height, width = band_da.rio.shape
+    row_start = max(0, math.floor(bbox_window.row_off - window_margin))
+    col_start = max(0, math.floor(bbox_window.col_off - window_margin))
+    row_stop = min(
+        height,
+        math.ceil(bbox_window.row_off + bbox_window.height + window_margin),
+    )
+    col_stop = min(
+        width,
+        math.ceil(bbox_window.col_off + bbox_window.width + window_margin),
+    )
+    if row_stop <= row_start or col_stop <= col_start:
+        raise ValueError(f"BBox {bbox} does not intersect band {band_path}")
+
+    window = Window.from_slices((row_start, row_stop), (col_start, col_stop))
+
+    return band_da.rio.isel_window(window), bbox
+
+
+def get_grid_block_windows(shape, block_size):
+    height, width = shape
+    return [
+        Window.from_slices(
+            (row_start, min(row_start + block_size, height)),
+            (col_start, min(col_start + block_size, width)),
+        )
+        for row_start in range(0, height, block_size)
+        for col_start in range(0, width, block_size)
+    ]
+
+
+def read_sentinel_band_window_on_grid(
+    band_path,
+    bbox: BBox,
+    grid_shape,
+    window: Window,
+    resampling_method=Resampling.bilinear,
+    window_margin=2,
+    use_overviews=True,
+    driver="JP2OpenJPEG",
+):
+    grid_height, grid_width = grid_shape
+    grid_crs = rio.crs.CRS.from_epsg(bbox.crs.epsg)
+    grid_transform = rio.transform.from_bounds(*bbox, grid_width, grid_height)
+    grid_resolution = abs(grid_transform.a)
+    # the window transform is derived from the grid transform, so a window
+    # of the grid is always warped with exactly the same parameters
+    window_shape = (int(window.height), int(window.width))
+    window_transform = rio.windows.transform(window, grid_transform)
+    window_bbox = BBox(
+        rio.transform.array_bounds(*window_shape, window_transform),
+        crs=bbox.crs,
+    )
+
+    band_da, band_bbox = open_sentinel_band_window(
+        band_path,
+        window_bbox,
+        window_margin=window_margin,
+        target_resolution=grid_resolution if use_overviews else None,
+        driver=driver,
+    )
+
+    # bands which already are on the AOI grid only need to be sliced,
+    # everything else gets warped from the padded window straight onto it
+    (source_resolution, _) = band_da.rio.resolution()
+    if band_da.rio.crs == grid_crs and math.isclose(
+        abs(source_resolution), grid_resolution
+    ):
+        clipped_da = band_da.rio.clip_box(*band_bbox)
+        if clipped_da.rio.shape == window_shape:
+            return clipped_da
+
+    return band_da.rio.reproject(
+        grid_crs,
+        shape=window_shape,
+        transform=window_transform,
+        resampling=resampling_method,
+    )
+
+
+def read_sentinel_band_on_grid(
+    band_path,
+    bbox: BBox,
+    shape,
+    resampling_method=Resampling.bilinear,
+    window_margin=2,
+    use_overviews=True,
+    driver="JP2OpenJPEG",
+    block_size=1024,
+):
+    read_window = functools.partial(
+        read_sentinel_band_window_on_grid,
+        band_path,
+        bbox,
+        tuple(shape),
+        resampling_method=resampling_method,
+        window_margin=window_margin,
+        use_overviews=use_overviews,
+        driver=driver,
+    )
+
+    # GDAL resamples depending on the extent of each warp, so larger grids
+    # are warped in fixed blocks - the lazy reads warp the very same blocks
+    # and therefore match this read exactly for any chunking
+    block_windows = get_grid_block_windows(shape, block_size)
+    first_block_da = read_window(block_windows[0])
+    if len(block_windows) == 1:
+        return first_block_da
+
+    height, width = shape
+    band_values = np.empty(
+        (first_block_da.shape[0], height, width), dtype=first_block_da.dtype
+    )
+    for block_window in block_windows:
+        block_da = (
+            first_block_da
+            if block_window == block_windows[0]
+            else read_window(block_window)
+        )
+        band_values[(slice(None), *block_window.toslices())] = block_da.values
+
+    grid_crs = rio.crs.CRS.from_epsg(bbox.crs.epsg)
+    grid_transform = rio.transform.from_bounds(*bbox, width, height)
+    band_da = xr.DataArray(
+        band_values,
+        coords={
+            "band": first_block_da.band.values,
+            **affine_to_coords(grid_transform, width, height),
+        },
+        dims=("band", "y", "x"),
+        attrs=first_block_da.attrs,
+    )
+
+    return band_da.rio.write_crs(grid_crs).rio.write_transform(grid_transform)
+
+
+def read_band_block(
+    band_path,
+    bbox: BBox,
+    grid_shape,
+    resampling_method=Resampling.bilinear,
+    window_margin=2,
+    use_overviews=True,
+    driver="JP2OpenJPEG",
+    block_info=None,
+):
+    # dask passes the location of the requested block within the full grid
+    (row_start, row_stop), (col_start, col_stop) = (
+        block_info[None]["array-location"]
+    )
+
+    return read_sentinel_band_window_on_grid(
+        band_path,
+        bbox,
+        grid_shape,
+        Window.from_slices((row_start, row_stop), (col_start, col_stop)),
+        resampling_method=resampling_method,
+        window_margin=window_margin,
+        use_overviews=use_overviews,
+        driver=driver,
+    ).values[0]
+
+
+def lazy_band_on_grid(
+    band_path,
+    bbox: BBox,
+    shape,
+    chunks=1024,
+    resampling_method=Resampling.bilinear,
+    window_margin=2,
+    use_overviews=True,
+    driver="JP2OpenJPEG",
+    block_size=1024,
+):
+    with rio.open(band_path, driver=driver) as src:
+        dtype = np.dtype(src.dtypes[0])
+
+    # every block of the AOI grid decodes and warps only its own window, the
+    # blocks are the ones of the eager read and get rechunked afterwards
+    read_block = functools.partial(
+        read_band_block,
+        band_path,
+        bbox,
+        tuple(shape),
+        resampling_method=resampling_method,
+        window_margin=window_margin,
+        use_overviews=use_overviews,
+        driver=driver,
+    )
+    band_array = da.map_blocks(
+        read_block,
+        chunks=da.core.normalize_chunks(block_size, tuple(shape)),
+        dtype=dtype,
+        meta=np.array((), dtype=dtype),
+    )
+
+    return band_array.rechunk(chunks)
+
+
+def supports_lazy_features():
+    # lazy features hook into how eo-learn 1.0 loads the FeatureIO values of
+    # an EOPatch on access (and on save), which is internal to eo-learn
+    return Version(eolearn.core.__version__) < Version("1.1")
+
+
+class LazyFeatureIO(FeatureIO):
+    def __init__(self, feature_type: FeatureType, lazy_data):
+        super().__init__(feature_type, None, None)
+        self.lazy_data = lazy_data
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.lazy_data!r})"
+
+    def load(self):
+        if self.loaded_value is None:
+            self.loaded_value = np.asarray(self.lazy_data.compute())
+
+        return self.loaded_value
+
+
+def make_lazy_feature(feature_type: FeatureType, lazy_data):
+    # other eo-learn versions get the computed array instead of a lazy one
+    if not supports_lazy_features():
+        return np.asarray(lazy_data.compute())
+
+    return LazyFeatureIO(feature_type, lazy_data)
+
+
+def compute_lazy_features(*eopatches, **compute_kwargs):
+    # computing the features of several EOPatches together lets them share
+    # one dask scheduler run instead of computing feature after feature
+    lazy_features = []
+    for eopatch in eopatches:
+        for feature_type in FeatureType:
+            if not feature_type.has_dict() or not feature_type.is_raster():
+                continue
+
+            for feature_name in eopatch[feature_type].keys():
+                value = eopatch[feature_type].__getitem__(
+                    feature_name, load=False
+                )
+                if (
+                    isinstance(value, LazyFeatureIO)
+                    and value.loaded_value is None
+                ):
+                    lazy_features.append(value)
+
+    computed_values = dask.compute(
+        *[feature.lazy_data for feature in lazy_features], **compute_kwargs
+    )
+    for feature, computed_value in zip(lazy_features, computed_values):
+        feature.loaded_value = np.asarray(computed_value)
+
+    return eopatches
+
+
+def read_sentinel_band(
+    band_path,
     bbox: BBox = None,
     target_shape=None,
     target_resolution=10,
     resampling_method=Resampling.bilinear,
-    requested_bands=None,
     digital_number_to_reflectance=False,
     dn_reflectance_factor=10000,
-    log_callback=None,
+    windowed_read=False,
+    window_margin=2,
+    use_overviews=True,
 ):
-    eopatch = EOPatch()
+    start_time = time.perf_counter()
 
+    if windowed_read and bbox is not None:
+        used_crs = rio.crs.CRS.from_epsg(bbox.crs.epsg)
+        band_bbox = bbox
+        band_da = read_sentinel_band_on_grid(
+            band_path,
+            bbox,
+            target_shape,
+            resampling_method=resampling_method,
+            window_margin=window_margin,
+            use_overviews=use_overviews,
+        )
+    else:
+        band_da = rx.open_rasterio(band_path, driver="JP2OpenJPEG")
+
+        if bbox is None:
+            used_crs = band_da.rio.crs
+            band_bbox = band_da.rio.bounds()
+        else:
+            used_crs = rio.crs.CRS.from_epsg(bbox.crs.epsg)
+            band_bbox = bbox
+            if bbox.crs.epsg != band_da.rio.crs.to_epsg():
+                bbox = bbox.transform(band_da.rio.crs.to_epsg())
+            band_da = band_da.rio.clip_box(*bbox)
+
+        (source_resolution, _) = band_da.rio.resolution()
+        source_resolution = abs(source_resolution)
+        # reprojecting and clipping can lead to an unequal amount of
+        # pixels per band to circumvent this we can either supply a
+        # shape as the parameter or fix a shape after going
+        # through the first band
+        if target_shape is None and source_resolution != target_resolution:
+            band_da = band_da.rio.reproject(
+                used_crs,
+                resolution=(target_resolution, target_resolution),
+                resampling=resampling_method,
+            )
+        elif target_shape is not None and (
+            source_resolution != target_resolution
+            or band_da.rio.shape != target_shape
+        ):
+            band_da = band_da.rio.reproject(
+                used_crs, shape=target_shape, resampling=resampling_method
+            )
+
+    band_data_values = band_da.values[0]
+    if digital_number_to_reflectance:
+        band_data_values = dn_to_reflectance(
+            band_data_values, dn_reflectance_factor
+        )
+
+    return (
+        band_data_values,
+        band_bbox,
+        used_crs,
+        time.perf_counter() - start_time,
+    )
+
+
+def construct_lazy_band_data(
+    band_paths,
+    bbox: BBox = None,
+    target_shape=None,
+    target_resolution=10,
+    resampling_method=Resampling.bilinear,
+    digital_number_to_reflectance=False,
+    dn_reflectance_factor=10000,
+    window_margin=2,
+    use_overviews=True,
+    chunks=1024,
+    driver="JP2OpenJPEG",
+    block_size=1024,
+):
+    if bbox is None:
+        with rio.open(band_paths[0], driver=driver) as src:
+            bbox = BBox(tuple(src.bounds), crs=src.crs.to_epsg())
+
+    shape = (
+        get_grid_shape(bbox, target_resolution) if target_shape is None
+        else target_shape
+    )
+
+    band_arrays = []
+    for band_path in band_paths:
+        band_array = lazy_band_on_grid(
+            band_path,
+            bbox,
+            shape,
+            chunks=chunks,
+            resampling_method=resampling_method,
+            window_margin=window_margin,
+            use_overviews=use_overviews,
+            driver=driver,
+            block_size=block_size,
+        )
+        if digital_number_to_reflectance:
+            band_array = band_array.map_blocks(
+                dn_to_reflectance, dn_reflectance_factor, dtype=np.float32
+            )
+        band_arrays.append(band_array)
+
+    return bbox, da.stack(band_arrays, axis=-1)[np.newaxis, ...]
+
+
+def get_sentinel_band_jobs(
+    sentinel_archive, requested_bands=None, log_callback=None
+):
     mission, level, acq_time = extract_meta_from_path(sentinel_archive)
 
     bands_pattern = f"{sentinel_archive}/**/*.jp2"
@@ -133,61 +557,126 @@ def construct_eopatch_from_sentinel_archive(
     if len(bands_paths) < len(requested_bands):
         raise ValueError(f'Requested {len(requested_bands)} but only found {len(bands_paths)}.')
 
-    band_data_arrays = []
-    agreed_bbox = None if bbox is None else bbox
-    agreed_shape = None if target_shape is None else target_shape
-    used_crs = None
+    band_jobs = []
     for bandname in requested_bands.values():
         res_bandpath = [path for (bn, path) in bands_paths if bn == bandname]
         if len(res_bandpath) > 0:
-            band_da = rx.open_rasterio(res_bandpath[0], driver="JP2OpenJPEG")
-
-            if used_crs is None and bbox is None:
-                used_crs = band_da.rio.crs
-            elif used_crs is None:
-                used_crs = rio.crs.CRS.from_epsg(bbox.crs.epsg)
-
-            if bbox is not None:
-                if bbox.crs.epsg != band_da.rio.crs.to_epsg():
-                    bbox = bbox.transform(band_da.rio.crs.to_epsg())
-                band_da = band_da.rio.clip_box(*bbox)
-            else:
-                agreed_bbox = band_da.rio.bounds()
-
-            (source_resolution, _) = band_da.rio.resolution()
-            source_resolution = abs(source_resolution)
-            # reprojecting and clipping can lead to an unequal amount of
-            # pixels per band to circumvent this we can either supply a
-            # shape as the parameter or fix a shape after going
-            # through the first band
-            if agreed_shape is None and source_resolution != target_resolution:
-                band_da = band_da.rio.reproject(
-                    used_crs,
-                    resolution=(target_resolution, target_resolution),
-                    resampling=resampling_method,
-                )
-            elif agreed_shape is not None and (
-                source_resolution != target_resolution
-                or band_da.rio.shape != agreed_shape
-            ):
-                band_da = band_da.rio.reproject(
-                    used_crs, shape=agreed_shape, resampling=resampling_method
-                )
+            band_jobs.append((bandname, res_bandpath[0]))
 
-            # all bands need to have the same shape
-            # we fix this after working with the first band
-            # if no shape is given as a parameter
-            if agreed_shape is None:
-                agreed_shape = band_da.rio.shape
+    if len(band_jobs) < 1:
+        raise ValueError("No bands found in sentinel archive")
 
-            band_data_values = band_da.values[0]
-            if digital_number_to_reflectance:
-                band_data_values = np.float32(band_data_values / dn_reflectance_factor)
+    return mission, level, acq_time, band_jobs
 
-            band_data_arrays.append(band_data_values)
 
-    if len(band_data_arrays) < 1:
-        raise ValueError("No bands found in sentinel archive")
+def construct_eopatch_from_sentinel_archive(
+    sentinel_archive,
+    bbox: BBox = None,
+    target_shape=None,
+    target_resolution=10,
+    resampling_method=Resampling.bilinear,
+    requested_bands=None,
+    digital_number_to_reflectance=False,
+    dn_reflectance_factor=10000,
+    log_callback=None,
+    windowed_read=False,
+    window_margin=2,
+    use_overviews=True,
+    max_workers=1,
+    executor_type="thread",
+    lazy=False,
+    chunks=1024,
+    store_digital_numbers=False,
+):
+    if executor_type not in ("thread", "process"):
+        raise ValueError(f"Executor type {executor_type} not supported")
+
+    # stored digital numbers keep the native uint16 data, the factor to get
+    # reflectances is recorded in meta_info and applied by the consumers
+    if store_digital_numbers:
+        digital_number_to_reflectance = False
+
+    eopatch = EOPatch()
+
+    mission, level, acq_time, band_jobs = get_sentinel_band_jobs(
+        sentinel_archive, requested_bands, log_callback
+    )
+    dn_reflectance_factor_key = get_dn_reflectance_factor_key(
+        (FeatureType.DATA, f"{level}_data")
+    )
+
+    agreed_shape = None if target_shape is None else target_shape
+    if windowed_read and bbox is not None and agreed_shape is None:
+        agreed_shape = get_grid_shape(bbox, target_resolution)
+
+    if lazy:
+        agreed_bbox, band_data = construct_lazy_band_data(
+            [path for (_, path) in band_jobs],
+            bbox,
+            target_shape=agreed_shape,
+            target_resolution=target_resolution,
+            resampling_method=resampling_method,
+            digital_number_to_reflectance=digital_number_to_reflectance,
+            dn_reflectance_factor=dn_reflectance_factor,
+            window_margin=window_margin,
+            use_overviews=use_overviews,
+            chunks=chunks,
+        )
+
+        eopatch.bbox = agreed_bbox
+        eopatch.timestamp = [acq_time]
+        eopatch[FeatureType.DATA, f"{level}_data"] = make_lazy_feature(
+            FeatureType.DATA, band_data
+        )
+        eopatch.meta_info["mission"] = mission
+        if store_digital_numbers:
+            eopatch.meta_info[dn_reflectance_factor_key] = (
+                dn_reflectance_factor
+            )
+
+        return eopatch
+
+    read_band = functools.partial(
+        read_sentinel_band,
+        bbox=bbox,
+        target_resolution=target_resolution,
+        resampling_method=resampling_method,
+        digital_number_to_reflectance=digital_number_to_reflectance,
+        dn_reflectance_factor=dn_reflectance_factor,
+        windowed_read=windowed_read,
+        window_margin=window_margin,
+        use_overviews=use_overviews,
+    )
+
+    # all bands need to have the same shape - if no shape is given as a
+    # parameter we fix it by reading the first band before fanning out
+    band_results = []
+    if agreed_shape is None:
+        _, first_band_path = band_jobs[0]
+        band_results.append(read_band(first_band_path, target_shape=None))
+        agreed_shape = band_results[0][0].shape
+
+    pending_paths = [path for (_, path) in band_jobs[len(band_results):]]
+    read_band = functools.partial(read_band, target_shape=agreed_shape)
+    if max_workers > 1 and len(pending_paths) > 1:
+        pool_executor = (
+            ProcessPoolExecutor if executor_type == "process"
+            else ThreadPoolExecutor
+        )
+        # map keeps the requested band order regardless of completion order
+        with pool_executor(max_workers=max_workers) as executor:
+            band_results.extend(executor.map(read_band, pending_paths))
+    else:
+        band_results.extend(map(read_band, pending_paths))
+
+    band_read_timings = {}
+    for (bandname, _), (_, _, _, elapsed) in zip(band_jobs, band_results):
+        band_read_timings[bandname] = elapsed
+        if log_callback:
+            log_callback(f"Read band {bandname} in {elapsed:.2f}s.")
+
+    band_data_arrays = [values for (values, _, _, _) in band_results]
+    _, agreed_bbox, used_crs, _ = band_results[0]
 
     temporal_dim = 1  # only one timestamp
     height, width = band_data_arrays[0].shape
@@ -200,6 +689,84 @@ def construct_eopatch_from_sentinel_archive(
     eopatch.timestamp = [acq_time]
     eopatch[FeatureType.DATA, f"{level}_data"] = band_data
     eopatch.meta_info["mission"] = mission
+    eopatch.meta_info[f"{level}_band_read_timings"] = band_read_timings
+    if store_digital_numbers:
+        eopatch.meta_info[dn_reflectance_factor_key] = dn_reflectance_factor
+
+    return eopatch
+
+
+def construct_time_series_eopatch_from_sentinel_archives(
+    sentinel_archives,
+    bbox: BBox = None,
+    target_shape=None,
+    target_resolution=10,
+    log_callback=None,
+    **read_kwargs,
+):
+    if len(sentinel_archives) < 1:
+        raise ValueError("No sentinel archives given")
+    if read_kwargs.get("lazy", False):
+        raise ValueError("Lazy reads are not supported for time series")
+
+    sentinel_archives = sorted(
+        sentinel_archives, key=lambda path: extract_meta_from_path(path)[2]
+    )
+    levels = set(extract_meta_from_path(path)[1] for path in sentinel_archives)
+    if len(levels) > 1:
+        raise ValueError(f"Can not stack archives of levels {sorted(levels)}")
+
+    (level,) = levels
+    feature = (FeatureType.DATA, f"{level}_data")
+
+    # the first scene fixes the grid, all following scenes are read onto it
+    # and written into one preallocated (time, height, width, bands) array
+    eopatch = None
+    for index, sentinel_archive in enumerate(sentinel_archives):
+        scene_eopatch = construct_eopatch_from_sentinel_archive(
+            sentinel_archive,
+            bbox=bbox,
+            target_shape=target_shape,
+            target_resolution=target_resolution,
+            log_callback=log_callback,
+            **read_kwargs,
+        )
+
+        if eopatch is None:
+            _, height, width, channels = scene_eopatch[feature].shape
+            bbox = scene_eopatch.bbox
+            target_shape = (height, width)
+
+            band_data = np.empty(
+                (len(sentinel_archives), height, width, channels),
+                dtype=scene_eopatch[feature].dtype,
+            )
+            eopatch = EOPatch()
+            eopatch.bbox = bbox
+            eopatch.meta_info["mission"] = []
+            eopatch.meta_info[f"{level}_band_read_timings"] = []
+
+        band_data[index] = scene_eopatch[feature][0]
+        eopatch.meta_info["mission"].append(scene_eopatch.meta_info["mission"])
+        dn_reflectance_factor_key = get_dn_reflectance_factor_key(feature)
+        if dn_reflectance_factor_key in scene_eopatch.meta_info:
+            eopatch.meta_info[dn_reflectance_factor_key] = (
+                scene_eopatch.meta_info[dn_reflectance_factor_key]
+            )
+        eopatch.meta_info[f"{level}_band_read_timings"].append(
+            scene_eopatch.meta_info[f"{level}_band_read_timings"]
+        )
+
+        if log_callback:
+            log_callback(
+                f"Read scene {index + 1}/{len(sentinel_archives)} "
+                f"{os.path.basename(sentinel_archive)}."
+            )
+
+    eopatch.timestamp = [
+        extract_meta_from_path(path)[2] for path in sentinel_archives
+    ]
+    eopatch[feature] = band_data
 
     return eopatch
 
@@ -215,6 +782,14 @@ class ReadSentinelArchiveTask(EOTask):
         digital_number_to_reflectance=False,
         dn_reflectance_factor=10000,
         log_callback=None,
+        windowed_read=False,
+        window_margin=2,
+        use_overviews=True,
+        max_workers=1,
+        executor_type="thread",
+        lazy=False,
+        chunks=1024,
+        store_digital_numbers=False,
     ):
         self.bbox = bbox
         self.target_shape = target_shape
@@ -224,6 +799,14 @@ class ReadSentinelArchiveTask(EOTask):
         self.digital_number_to_reflectance = digital_number_to_reflectance
         self.dn_reflectance_factor = dn_reflectance_factor
         self.log_callback = log_callback
+        self.windowed_read = windowed_read
+        self.window_margin = window_margin
+        self.use_overviews = use_overviews
+        self.max_workers = max_workers
+        self.executor_type = executor_type
+        self.lazy = lazy
+        self.chunks = chunks
+        self.store_digital_numbers = store_digital_numbers
 
     def execute(self, sentinel_archive_path):
         return construct_eopatch_from_sentinel_archive(
@@ -236,4 +819,309 @@ class ReadSentinelArchiveTask(EOTask):
             self.digital_number_to_reflectance,
             self.dn_reflectance_factor,
             self.log_callback,
+            self.windowed_read,
+            self.window_margin,
+            self.use_overviews,
+            self.max_workers,
+            self.executor_type,
+            self.lazy,
+            self.chunks,
+            self.store_digital_numbers,
+        )
+
+
+def get_band_fill_value(nodata, dtype):
+    # same fill value as rioxarray uses when warping in the windowed reads,
+    # the band nodata value or the nodata default of its data type
+    if nodata is not None:
+        return nodata
+
+    dtype = np.dtype(dtype)
+    if np.issubdtype(dtype, np.unsignedinteger):
+        return np.iinfo(dtype).max
+    if np.issubdtype(dtype, np.integer):
+        return np.iinfo(dtype).min
+
+    return np.nan
+
+
+def get_band_window_for_bbox(src, bbox: BBox, window_margin=2):
+    if bbox.crs.epsg != src.crs.to_epsg():
+        bbox = bbox.transform(src.crs.to_epsg())
+
+    bbox_window = rio.windows.from_bounds(*bbox, transform=src.transform)
+
+    return Window.from_slices(
+        (
+            max(0, math.floor(bbox_window.row_off - window_margin)),
+            min(
+                src.height,
+                math.ceil(
+                    bbox_window.row_off + bbox_window.height + window_margin
+                ),
+            ),
+        ),
+        (
+            max(0, math.floor(bbox_window.col_off - window_margin)),
+            min(
+                src.width,
+                math.ceil(
+                    bbox_window.col_off + bbox_window.width + window_margin
+                ),
+            ),
+        ),
+    )
+
+
+def read_aoi_grids_from_window(
+    band_path,
+    aoi_grids,
+    overview_level=None,
+    resampling_method=Resampling.bilinear,
+    window_margin=2,
+    driver="JP2OpenJPEG",
+):
+    open_kwargs = (
+        {} if overview_level is None else {"OVERVIEW_LEVEL": overview_level}
+    )
+    with rio.open(band_path, driver=driver, **open_kwargs) as src:
+        band_crs = src.crs
+        src_transform = src.transform
+        src_nodata = src.nodata
+        aoi_windows = [
+            get_band_window_for_bbox(src, bbox, window_margin=window_margin)
+            for (bbox, _, _, _) in aoi_grids
+        ]
+        # the window covering all AOIs gets decoded only once
+        read_window = rio.windows.union(*aoi_windows)
+        band_values = src.read(1, window=read_window)
+
+    read_transform = rio.windows.transform(read_window, src_transform)
+    read_height, read_width = band_values.shape
+
+    aoi_values = []
+    for (bbox, shape, grid_crs, grid_transform), aoi_window in zip(
+        aoi_grids, aoi_windows
+    ):
+        # bands which already are on the AOI grid only need to be sliced
+        grid_window = rio.windows.from_bounds(*bbox, transform=read_transform)
+        row_off = round(grid_window.row_off)
+        col_off = round(grid_window.col_off)
+        if (
+            grid_crs == band_crs
+            and math.isclose(abs(read_transform.a), abs(grid_transform.a))
+            and is_pixel_aligned(grid_window)
+            and (round(grid_window.height), round(grid_window.width)) == shape
+            and 0 <= row_off <= read_height - shape[0]
+            and 0 <= col_off <= read_width - shape[1]
+        ):
+            aoi_values.append(
+                band_values[
+                    row_off:row_off + shape[0], col_off:col_off + shape[1]
+                ]
+            )
+            continue
+
+        # everything else is warped from the padded window of the AOI
+        row_off = int(aoi_window.row_off - read_window.row_off)
+        col_off = int(aoi_window.col_off - read_window.col_off)
+        fill_value = get_band_fill_value(src_nodata, band_values.dtype)
+        values = np.full(shape, fill_value, dtype=band_values.dtype)
+        rio.warp.reproject(
+            band_values[
+                row_off:row_off + int(aoi_window.height),
+                col_off:col_off + int(aoi_window.width),
+            ],
+            values,
+            src_transform=rio.windows.transform(aoi_window, src_transform),
+            src_crs=band_crs,
+            src_nodata=src_nodata,
+            dst_transform=grid_transform,
+            dst_crs=grid_crs,
+            dst_nodata=fill_value,
+            resampling=resampling_method,
+        )
+        aoi_values.append(values)
+
+    return aoi_values
+
+
+def read_sentinel_band_for_aois(
+    band_path,
+    aois,
+    resampling_method=Resampling.bilinear,
+    digital_number_to_reflectance=False,
+    dn_reflectance_factor=10000,
+    window_margin=2,
+    use_overviews=True,
+    driver="JP2OpenJPEG",
+):
+    # aois is a list of (bbox, shape) grids - AOIs which use the same
+    # overview level share one decoded window, so a band is decoded once per
+    # resolution level instead of once per AOI
+    start_time = time.perf_counter()
+
+    aoi_grids = [
+        (
+            bbox,
+            tuple(shape),
+            rio.crs.CRS.from_epsg(bbox.crs.epsg),
+            rio.transform.from_bounds(*bbox, shape[1], shape[0]),
+        )
+        for (bbox, shape) in aois
+    ]
+
+    overview_groups = {}
+    with rio.open(band_path, driver=driver) as src:
+        for aoi_index, (bbox, _, grid_crs, grid_transform) in enumerate(
+            aoi_grids
+        ):
+            # resolutions are only comparable if AOI and band share units
+            overview_level = (
+                select_overview_level(src, abs(grid_transform.a))
+                if use_overviews and grid_crs == src.crs
+                else None
+            )
+            overview_groups.setdefault(overview_level, []).append(aoi_index)
+
+    aoi_values = [None] * len(aoi_grids)
+    for overview_level, aoi_indices in overview_groups.items():
+        group_values = read_aoi_grids_from_window(
+            band_path,
+            [aoi_grids[index] for index in aoi_indices],
+            overview_level=overview_level,
+            resampling_method=resampling_method,
+            window_margin=window_margin,
+            driver=driver,
+        )
+        for aoi_index, values in zip(aoi_indices, group_values):
+            if digital_number_to_reflectance:
+                values = dn_to_reflectance(values, dn_reflectance_factor)
+            aoi_values[aoi_index] = values
+
+    return aoi_values, time.perf_counter() - start_time
+
+
+def construct_eopatches_from_sentinel_archive_for_aois(
+    sentinel_archive,
+    aois,
+    target_resolution=10,
+    resampling_method=Resampling.bilinear,
+    requested_bands=None,
+    digital_number_to_reflectance=False,
+    dn_reflectance_factor=10000,
+    log_callback=None,
+    window_margin=2,
+    use_overviews=True,
+    max_workers=1,
+    store_digital_numbers=False,
+):
+    if store_digital_numbers:
+        digital_number_to_reflectance = False
+
+    # aois is a list of (bbox, target_shape) pairs, a missing shape is
+    # derived from the target resolution - one EOPatch per AOI is returned
+    mission, level, acq_time, band_jobs = get_sentinel_band_jobs(
+        sentinel_archive, requested_bands, log_callback
+    )
+    aois = [
+        (
+            bbox,
+            get_grid_shape(bbox, target_resolution) if shape is None
+            else tuple(shape),
+        )
+        for (bbox, shape) in aois
+    ]
+
+    read_band = functools.partial(
+        read_sentinel_band_for_aois,
+        aois=aois,
+        resampling_method=resampling_method,
+        digital_number_to_reflectance=digital_number_to_reflectance,
+        dn_reflectance_factor=dn_reflectance_factor,
+        window_margin=window_margin,
+        use_overviews=use_overviews,
+    )
+    band_paths = [path for (_, path) in band_jobs]
+    if max_workers > 1 and len(band_paths) > 1:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            band_results = list(executor.map(read_band, band_paths))
+    else:
+        band_results = list(map(read_band, band_paths))
+
+    band_read_timings = {}
+    for (bandname, _), (_, elapsed) in zip(band_jobs, band_results):
+        band_read_timings[bandname] = elapsed
+        if log_callback:
+            log_callback(
+                f"Read band {bandname} for {len(aois)} AOIs in {elapsed:.2f}s."
+            )
+
+    eopatches = []
+    for aoi_index, (bbox, (height, width)) in enumerate(aois):
+        band_data = np.empty(
+            (1, height, width, len(band_jobs)),
+            dtype=band_results[0][0][aoi_index].dtype,
+        )
+        for band_index, (aoi_values, _) in enumerate(band_results):
+            band_data[0, :, :, band_index] = aoi_values[aoi_index]
+
+        eopatch = EOPatch()
+        eopatch.bbox = bbox
+        eopatch.timestamp = [acq_time]
+        eopatch[FeatureType.DATA, f"{level}_data"] = band_data
+        eopatch.meta_info["mission"] = mission
+        eopatch.meta_info[f"{level}_band_read_timings"] = band_read_timings
+        if store_digital_numbers:
+            eopatch.meta_info[
+                get_dn_reflectance_factor_key(
+                    (FeatureType.DATA, f"{level}_data")
+                )
+            ] = dn_reflectance_factor
+        eopatches.append(eopatch)
+
+    return eopatches
+
+
+class ReadSentinelArchiveForAOIsTask(EOTask):
+    def __init__(
+        self,
+        aois,
+        target_resolution=10,
+        resampling_method=Resampling.bilinear,
+        requested_bands=None,
+        digital_number_to_reflectance=False,
+        dn_reflectance_factor=10000,
+        log_callback=None,
+        window_margin=2,
+        use_overviews=True,
+        max_workers=1,
+        store_digital_numbers=False,
+    ):
+        self.aois = aois
+        self.target_resolution = target_resolution
+        self.resampling_method = resampling_method
+        self.requested_bands = requested_bands
+        self.digital_number_to_reflectance = digital_number_to_reflectance
+        self.dn_reflectance_factor = dn_reflectance_factor
+        self.log_callback = log_callback
+        self.window_margin = window_margin
+        self.use_overviews = use_overviews
+        self.max_workers = max_workers
+        self.store_digital_numbers = store_digital_numbers
+
+    def execute(self, sentinel_archive_path):
+        return construct_eopatches_from_sentinel_archive_for_aois(
+            sentinel_archive_path,
+            self.aois,
+            self.target_resolution,
+            self.resampling_method,
+            self.requested_bands,
+            self.digital_number_to_reflectance,
+            self.dn_reflectance_factor,
+            self.log_callback,
+            self.window_margin,
+            self.use_overviews,
+            self.max_workers,
+            self.store_digital_numbers,
         )
@@ -2,40 +2,77 @@ from eolearn.core import EOTask, EOPatch, FeatureType
 import numpy as np
 
 
+# label values of the compact split raster, 0 marks pixels without valid data -
+# the values are the same for two and three way splits, unlike the markers of
+# TrainTestSplitTask (train 1 and test 2, or train 1, validation 2 and test 3),
+# and are also stored in the split_label_values meta info of every EOPatch
+split_label_values = {
+    'train': 1,
+    'test': 2,
+    'validation': 3,
+}
+
+
+def get_split_indices_feature(split_name):
+    return (FeatureType.SCALAR_TIMELESS, f'{split_name}_split_indices')
+
+
+def get_split_label_values(eopatch: EOPatch):
+    return eopatch.meta_info.get('split_label_values', split_label_values)
+
+
 class AddValidTrainTestMasks(EOTask):
     def __init__(self,
                  train_test_maks_feature,
-                 valid_data_mask_feature):
+                 valid_data_mask_feature,
+                 split_labels_feature=(FeatureType.MASK_TIMELESS, 'split_labels'),
+                 add_split_masks=False):
         self.train_test_maks_feature = train_test_maks_feature
         self.valid_data_mask_feature = valid_data_mask_feature
+        self.split_labels_feature = split_labels_feature
+        self.add_split_masks = add_split_masks
 
     def execute(self, eopatch: EOPatch):
         result_eop = eopatch.copy()
 
-        bin_values = np.unique(result_eop[self.train_test_maks_feature])
+        train_test_split = result_eop[self.train_test_maks_feature][:, :, 0]
+        valid_data = result_eop[self.valid_data_mask_feature][:, :, 0] == 1
+
+        bin_values = np.unique(train_test_split)
 
-        train_marker = 1
         if len(bin_values) == 2:
-            test_marker = 2
+            split_markers = {'train': 1, 'test': 2}
         elif len(bin_values) == 3:
-            validation_marker = 2
-            test_marker = 3
+            split_markers = {'train': 1, 'validation': 2, 'test': 3}
         else:
             raise ValueError("Only supporting train/test or train/validation/test splits.")
 
-        # multiplication by one to do an implicit type cast to a numerical value
-        result_eop[(FeatureType.MASK_TIMELESS, 'train_split_valid')] = ((result_eop[self.train_test_maks_feature] == train_marker ) & (result_eop[self.valid_data_mask_feature] == 1)) * 1
-        if len(bin_values) == 3:
-            result_eop[(FeatureType.MASK_TIMELESS, 'validation_split_valid')] = ((result_eop[self.train_test_maks_feature] == validation_marker) & (result_eop[self.valid_data_mask_feature] == 1)) * 1
-        # multiplication by one to do an implicit type cast to a numerical value
-        result_eop[(FeatureType.MASK_TIMELESS, 'test_split_valid')] = ((result_eop[self.train_test_maks_feature] == test_marker) & (result_eop[self.valid_data_mask_feature] == 1)) * 1
+        # the whole split is kept in a single uint8 raster, each split also
+        # gets its sorted flat pixel indices so that downstream code can
+        # gather pixels without scanning a full size mask again - the full
+        # size per split masks are only added with add_split_masks
+        split_labels = np.zeros(train_test_split.shape, dtype=np.uint8)
+        index_dtype = np.int32 if split_labels.size < 2 ** 31 else np.int64
+        split_counts = {'train': 0, 'validation': 0, 'test': 0}
+        for split_name, marker in split_markers.items():
+            split_index = (train_test_split == marker) & valid_data
+            split_labels[split_index] = split_label_values[split_name]
 
-        traincount = np.sum(result_eop[(FeatureType.MASK_TIMELESS, 'train_split_valid')] == 1)
-        if len(bin_values) == 3:
-            validationcount = np.sum(result_eop[(FeatureType.MASK_TIMELESS, 'validation_split_valid')] == 1)
-        else:
-            validationcount = 0
-        testcount = np.sum(result_eop[(FeatureType.MASK_TIMELESS, 'test_split_valid')] == 1)
+            split_indices = np.flatnonzero(split_index).astype(index_dtype)
+            result_eop[get_split_indices_feature(split_name)] = split_indices
+            split_counts[split_name] = len(split_indices)
+
+            if self.add_split_masks:
+                result_eop[(FeatureType.MASK_TIMELESS, f'{split_name}_split_valid')] = (
+                    split_index[..., np.newaxis].astype(np.uint8)
+                )
+
+        result_eop[self.split_labels_feature] = split_labels[..., np.newaxis]
+        result_eop.meta_info['split_label_values'] = dict(split_label_values)
+
+        traincount = split_counts['train']
+        validationcount = split_counts['validation']
+        testcount = split_counts['test']
 
         result_eop.meta_info['train_count'] = traincount
         result_eop.meta_info['test_count'] = testcount
@@ -45,3 +82,183 @@ class AddValidTrainTestMasks(EOTask):
         result_eop.meta_info['validation_perc'] = validationcount / (traincount + testcount + validationcount)
 
         return result_eop
+
+
+def get_pixel_priorities(pixel_indices, seed=0):
+    # splitmix64 hash of the flat pixel index - every pixel gets the same
+    # random priority independent of the order or blocks it is seen in, so
+    # samples drawn from it are reproducible and can be merged block by block
+    with np.errstate(over='ignore'):
+        z = pixel_indices.astype(np.uint64) + np.uint64(seed) * np.uint64(
+            0x9E3779B97F4A7C15
+        )
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+
+    return z ^ (z >> np.uint64(31))
+
+
+def keep_lowest_priorities(priorities, pixel_indices, size):
+    if len(priorities) <= size:
+        return priorities, pixel_indices
+
+    keep = np.argpartition(priorities, size - 1)[:size]
+    return priorities[keep], pixel_indices[keep]
+
+
+def thin_pixels(pixel_indices, priorities, width, thinning_distance):
+    # keeps the pixel with the lowest priority of every thinning_distance x
+    # thinning_distance cell - this bounds the sample density to one pixel
+    # per cell, pixels of neighbouring cells can still be direct neighbours
+    rows, cols = np.divmod(pixel_indices, width)
+    cells = (rows // thinning_distance) * (width // thinning_distance + 1) + (
+        cols // thinning_distance
+    )
+    order = np.lexsort((priorities, cells))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = cells[order][1:] != cells[order][:-1]
+    keep = order[first]
+
+    return pixel_indices[keep], priorities[keep]
+
+
+def allocate_stratum_sizes(available_sizes, target_size):
+    # equal shares for all strata, the share a small stratum can not fill is
+    # passed on to the remaining strata
+    sizes = np.zeros(len(available_sizes), dtype=np.int64)
+    open_strata = [i for (i, size) in enumerate(available_sizes) if size > 0]
+    remaining = target_size
+    while remaining > 0 and open_strata:
+        share = max(1, remaining // len(open_strata))
+        for i in list(open_strata):
+            added = min(share, available_sizes[i] - sizes[i], remaining)
+            sizes[i] += added
+            remaining -= added
+            if sizes[i] == available_sizes[i]:
+                open_strata.remove(i)
+            if remaining == 0:
+                break
+
+    return sizes
+
+
+def sample_depth_stratified_pixels(
+    pixel_indices,
+    depth,
+    depth_bins,
+    target_size,
+    thinning_distance=1,
+    seed=0,
+    block_size=2 ** 20,
+):
+    # pixel_indices are the sorted flat indices of a split and depth the
+    # (height, width) label raster - the indices are streamed in blocks of
+    # whole thinning cell rows and every stratum only keeps the target_size
+    # pixels with the lowest priority seen so far
+    height, width = depth.shape
+    depth_bins = np.asarray(depth_bins)
+    stratum_count = len(depth_bins) - 1
+    flat_depth = depth.reshape(-1)
+
+    kept = [
+        (np.empty(0, dtype=np.uint64), np.empty(0, dtype=pixel_indices.dtype))
+        for _ in range(stratum_count)
+    ]
+    rows_per_block = thinning_distance * max(
+        1, block_size // (thinning_distance * width)
+    )
+    for row in range(0, height, rows_per_block):
+        start, end = np.searchsorted(
+            pixel_indices, [row * width, (row + rows_per_block) * width]
+        )
+        block_indices = pixel_indices[start:end]
+        if len(block_indices) < 1:
+            continue
+
+        priorities = get_pixel_priorities(block_indices, seed)
+        if thinning_distance > 1:
+            block_indices, priorities = thin_pixels(
+                block_indices, priorities, width, thinning_distance
+            )
+
+        # pixels outside of the bins and without depth are never sampled,
+        # the last bin also includes its upper edge
+        block_depth = flat_depth[block_indices]
+        strata = np.digitize(block_depth, depth_bins) - 1
+        strata[block_depth == depth_bins[-1]] = stratum_count - 1
+        for stratum in range(stratum_count):
+            in_stratum = strata == stratum
+            if not np.any(in_stratum):
+                continue
+
+            kept_priorities, kept_indices = kept[stratum]
+            kept[stratum] = keep_lowest_priorities(
+                np.concatenate([kept_priorities, priorities[in_stratum]]),
+                np.concatenate([kept_indices, block_indices[in_stratum]]),
+                target_size,
+            )
+
+    stratum_sizes = allocate_stratum_sizes(
+        [len(indices) for (_, indices) in kept], target_size
+    )
+    sample_indices = np.concatenate(
+        [
+            keep_lowest_priorities(priorities, indices, size)[1]
+            for ((priorities, indices), size) in zip(kept, stratum_sizes)
+        ]
+    )
+
+    return np.sort(sample_indices), stratum_sizes
+
+
+class AddDepthStratifiedSample(EOTask):
+    def __init__(self,
+                 depth_bins,
+                 target_size,
+                 split_name='train',
+                 sample_name=None,
+                 label_feature=(FeatureType.DATA_TIMELESS, 'bathy_data'),
+                 split_labels_feature=(FeatureType.MASK_TIMELESS, 'split_labels'),
+                 thinning_distance=1,
+                 seed=0):
+        self.depth_bins = depth_bins
+        self.target_size = target_size
+        self.split_name = split_name
+        self.sample_name = f'{split_name}_sample' if sample_name is None else sample_name
+        self.label_feature = label_feature
+        self.split_labels_feature = split_labels_feature
+        self.thinning_distance = thinning_distance
+        self.seed = seed
+
+    def execute(self, eopatch: EOPatch):
+        # runs after AddValidTrainTestMasks, the sample is stored like a split
+        # as sorted flat pixel indices and can be gathered the same way
+        result_eop = eopatch.copy()
+
+        indices_feature = get_split_indices_feature(self.split_name)
+        if indices_feature in eopatch:
+            split_indices = eopatch[indices_feature]
+        else:
+            split_indices = np.flatnonzero(
+                eopatch[self.split_labels_feature][:, :, 0]
+                == split_label_values[self.split_name]
+            )
+
+        sample_indices, stratum_sizes = sample_depth_stratified_pixels(
+            split_indices,
+            eopatch[self.label_feature][:, :, 0],
+            self.depth_bins,
+            self.target_size,
+            thinning_distance=self.thinning_distance,
+            seed=self.seed,
+        )
+
+        result_eop[get_split_indices_feature(self.sample_name)] = (
+            sample_indices.astype(split_indices.dtype)
+        )
+        result_eop.meta_info[f'{self.sample_name}_count'] = len(sample_indices)
+        result_eop.meta_info[f'{self.sample_name}_stratum_counts'] = [
+            int(size) for size in stratum_sizes
+        ]
+
+        return result_eop
@@ -0,0 +1,335 @@
+import os
+import json
+import contextlib
+import multiprocessing
+from collections import namedtuple
+
+from eolearn.core import (
+    EOExecutor,
+    EONode,
+    EOPatch,
+    EOTask,
+    EOWorkflow,
+    MergeEOPatchesTask,
+    OverwritePermission,
+    SaveTask,
+)
+
+from eolearn_extras.catalog import (
+    SceneCatalog,
+    select_best_scene_per_acquisition,
+)
+from eolearn_extras.io import construct_eopatch_from_sentinel_archive
+from eolearn_extras.tiling import get_grid_shape
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+AOI = namedtuple(
+    "AOI",
+    ["name", "bbox", "target_shape", "reference_eopatch_path"],
+    defaults=(None, None),
+)
+
+BatchJob = namedtuple("BatchJob", ["name", "aoi", "acq_time", "products"])
+
+# a decoded 10m Sentinel-2 band of a full 10980 x 10980 pixel tile plus the
+# warped copy of it - the dominant memory cost of a single band read
+default_read_memory_bytes = 2 * 10980 * 10980 * 4
+
+
+def build_batch_jobs(
+    catalog: SceneCatalog,
+    aois,
+    levels=("L1C", "L2A"),
+    start_time=None,
+    end_time=None,
+    min_coverage=1.0,
+    max_cloud_fraction=None,
+):
+    # one job per AOI and acquisition for which all levels are available
+    jobs = []
+    for aoi in aois:
+        scenes_by_level = [
+            dict(
+                (scene.acq_time, scene)
+                for scene in select_best_scene_per_acquisition(
+                    catalog.find_scenes(
+                        level,
+                        start_time=start_time,
+                        end_time=end_time,
+                        bbox=aoi.bbox,
+                        min_coverage=min_coverage,
+                        max_cloud_fraction=max_cloud_fraction,
+                    ),
+                    bbox=aoi.bbox,
+                )
+            )
+            for level in levels
+        ]
+        acq_times = set.intersection(
+            *[set(scenes) for scenes in scenes_by_level]
+        )
+        for acq_time in sorted(acq_times):
+            jobs.append(
+                BatchJob(
+                    f"{aoi.name}/{acq_time.strftime('%Y%m%dT%H%M%S')}",
+                    aoi,
+                    acq_time,
+                    dict(
+                        (level, scenes[acq_time].path)
+                        for (level, scenes) in zip(levels, scenes_by_level)
+                    ),
+                )
+            )
+
+    return jobs
+
+
+def get_execution_name(job: BatchJob):
+    # EOExecutor writes a log file per execution name, the aoi/acq_time job
+    # name is only used as the output folder
+    return job.name.replace("/", "__")
+
+
+def get_max_concurrent_reads(
+    workers, memory_limit_bytes=None, read_memory_bytes=None
+):
+    if memory_limit_bytes is None:
+        if psutil is None:
+            return workers
+        memory_limit_bytes = 0.75 * psutil.virtual_memory().available
+
+    read_memory_bytes = (
+        default_read_memory_bytes if read_memory_bytes is None
+        else read_memory_bytes
+    )
+
+    return max(1, min(workers, int(memory_limit_bytes // read_memory_bytes)))
+
+
+class ReadSceneTask(EOTask):
+    def __init__(self, read_slots=None, **read_kwargs):
+        # read_slots is a semaphore shared by all worker processes, it
+        # bounds the number of scenes decoded at the same time independently
+        # of the number of workers
+        self.read_slots = read_slots
+        self.read_kwargs = read_kwargs
+
+    def execute(self, sentinel_archive_path, bbox=None, target_shape=None):
+        read_slot = (
+            contextlib.nullcontext() if self.read_slots is None
+            else self.read_slots
+        )
+        with read_slot:
+            return construct_eopatch_from_sentinel_archive(
+                sentinel_archive_path,
+                bbox=bbox,
+                target_shape=target_shape,
+                **self.read_kwargs,
+            )
+
+
+class LoadReferenceTask(EOTask):
+    def execute(self, eopatch_path=None):
+        if eopatch_path is None:
+            return EOPatch()
+
+        return EOPatch.load(eopatch_path, lazy_loading=False)
+
+
+class BatchProgress:
+    def __init__(self, progress_path):
+        self.progress_path = os.path.abspath(progress_path)
+        self.entries = {}
+
+        if os.path.isfile(self.progress_path):
+            with open(self.progress_path) as f:
+                self.entries = json.load(f)
+
+    def is_done(self, job_name):
+        return self.entries.get(job_name, {}).get("status") == "done"
+
+    def update(self, job_name, status, attempts, error=None):
+        self.entries[job_name] = {
+            "status": status,
+            "attempts": attempts,
+            "error": error,
+        }
+
+    def save(self):
+        tmp_path = f"{self.progress_path}.tmp-{os.getpid()}"
+        with open(tmp_path, "w") as f:
+            json.dump(self.entries, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.progress_path)
+
+
+class BatchPipeline:
+    def __init__(
+        self,
+        output_root,
+        levels=("L1C", "L2A"),
+        target_resolution=10,
+        workers=4,
+        max_concurrent_reads=None,
+        memory_limit_bytes=None,
+        read_memory_bytes=None,
+        max_retries=2,
+        batch_size=None,
+        logs_folder=None,
+        log_callback=None,
+        **read_kwargs,
+    ):
+        self.output_root = os.path.abspath(output_root)
+        self.levels = levels
+        self.target_resolution = target_resolution
+        self.workers = workers
+        self.max_concurrent_reads = (
+            get_max_concurrent_reads(
+                workers, memory_limit_bytes, read_memory_bytes
+            )
+            if max_concurrent_reads is None else max_concurrent_reads
+        )
+        self.max_retries = max_retries
+        self.batch_size = 4 * workers if batch_size is None else batch_size
+        self.logs_folder = (
+            os.path.join(self.output_root, "executor_logs")
+            if logs_folder is None else logs_folder
+        )
+        self.log_callback = log_callback
+        self.read_kwargs = dict(
+            dict(
+                target_resolution=target_resolution,
+                windowed_read=True,
+                digital_number_to_reflectance=True,
+            ),
+            **read_kwargs,
+        )
+
+        os.makedirs(self.output_root, exist_ok=True)
+        self.progress = BatchProgress(
+            os.path.join(self.output_root, "progress.json")
+        )
+
+    def build_workflow(self, read_slots=None):
+        reference_node = EONode(LoadReferenceTask(), inputs=tuple())
+        read_nodes = [
+            EONode(
+                ReadSceneTask(read_slots=read_slots, **self.read_kwargs),
+                inputs=tuple(),
+                name=f"read_{level}",
+            )
+            for level in self.levels
+        ]
+        merge_node = EONode(
+            MergeEOPatchesTask(), inputs=[reference_node, *read_nodes]
+        )
+        save_node = EONode(
+            SaveTask(
+                self.output_root,
+                overwrite_permission=OverwritePermission.OVERWRITE_PATCH,
+            ),
+            inputs=[merge_node],
+        )
+
+        return (
+            EOWorkflow([reference_node, *read_nodes, merge_node, save_node]),
+            reference_node,
+            read_nodes,
+            save_node,
+        )
+
+    def get_execution_kwargs(self, job, reference_node, read_nodes, save_node):
+        target_shape = job.aoi.target_shape
+        if target_shape is None:
+            target_shape = get_grid_shape(job.aoi.bbox, self.target_resolution)
+
+        execution_kwargs = {
+            reference_node: {"eopatch_path": job.aoi.reference_eopatch_path},
+            save_node: {"eopatch_folder": job.name},
+        }
+        for level, read_node in zip(self.levels, read_nodes):
+            execution_kwargs[read_node] = {
+                "sentinel_archive_path": job.products[level],
+                "bbox": job.aoi.bbox,
+                "target_shape": target_shape,
+            }
+
+        return execution_kwargs
+
+    def run(self, jobs):
+        # finished jobs of an earlier run are skipped, so an interrupted
+        # run can simply be started again with the same jobs
+        pending_jobs = [
+            job for job in jobs if not self.progress.is_done(job.name)
+        ]
+        if self.log_callback:
+            self.log_callback(
+                f"{len(pending_jobs)} of {len(jobs)} jobs pending, running "
+                f"{self.workers} workers with at most "
+                f"{self.max_concurrent_reads} concurrent reads."
+            )
+
+        with multiprocessing.Manager() as manager:
+            read_slots = manager.Semaphore(self.max_concurrent_reads)
+            workflow, *nodes = self.build_workflow(read_slots)
+
+            attempts = dict((job.name, 0) for job in pending_jobs)
+            for attempt in range(self.max_retries + 1):
+                if len(pending_jobs) < 1:
+                    break
+
+                failed_jobs = []
+                for start in range(0, len(pending_jobs), self.batch_size):
+                    batch_jobs = pending_jobs[start:start + self.batch_size]
+                    failed_jobs.extend(
+                        self.run_batch(workflow, nodes, batch_jobs, attempts)
+                    )
+
+                pending_jobs = failed_jobs
+                if self.log_callback and len(failed_jobs) > 0:
+                    self.log_callback(
+                        f"{len(failed_jobs)} jobs failed in attempt "
+                        f"{attempt + 1}/{self.max_retries + 1}."
+                    )
+
+        return pending_jobs
+
+    def run_batch(self, workflow, nodes, batch_jobs, attempts):
+        executor = EOExecutor(
+            workflow,
+            [self.get_execution_kwargs(job, *nodes) for job in batch_jobs],
+            execution_names=[get_execution_name(job) for job in batch_jobs],
+            save_logs=True,
+            logs_folder=self.logs_folder,
+        )
+        results = executor.run(workers=self.workers, multiprocess=True)
+
+        failed_jobs = []
+        for job, result in zip(batch_jobs, results):
+            attempts[job.name] += 1
+            if result.workflow_failed():
+                error_stats = result.stats[result.error_node_uid]
+                failed_jobs.append(job)
+                self.progress.update(
+                    job.name,
+                    "failed",
+                    attempts[job.name],
+                    error=repr(error_stats.exception),
+                )
+            else:
+                self.progress.update(job.name, "done", attempts[job.name])
+
+        # progress is persisted after every batch
+        self.progress.save()
+        if self.log_callback:
+            done_count = sum(
+                entry["status"] == "done"
+                for entry in self.progress.entries.values()
+            )
+            self.log_callback(f"{done_count} jobs done.")
+
+        return failed_jobs
@@ -1,12 +1,37 @@
 import numpy as np
 import rasterio as rio
 from rasterio.windows import Window
-from rasterio import MemoryFile
 from rasterio.enums import Resampling
 from eolearn.core import EOTask, EOPatch
 from sentinelhub import BBox
 
 
+def feature_to_band_stack(feature_data):
+    # GDAL works on band sequential (bands, rows, cols) arrays - timestamps
+    # and channels of (times, height, width, channels) features are folded
+    # into the band axis so that all of them can be processed in one call
+    if feature_data.ndim == 3:
+        feature_data = feature_data[np.newaxis, ...]
+
+    times, height, width, channels = feature_data.shape
+    band_stack = np.ascontiguousarray(np.transpose(feature_data, (0, 3, 1, 2)))
+
+    return band_stack.reshape(times * channels, height, width)
+
+
+def band_stack_to_feature(band_stack, times, channels):
+    # inverse of feature_to_band_stack - returns a view in eo-learn layout
+    _, height, width = band_stack.shape
+    feature_data = np.transpose(
+        band_stack.reshape(
+            1 if times is None else times, channels, height, width
+        ),
+        (0, 2, 3, 1),
+    )
+
+    return feature_data[0] if times is None else feature_data
+
+
 class ReprojectRasterTask(EOTask):
     def __init__(
         self,
@@ -15,9 +40,9 @@ class ReprojectRasterTask(EOTask):
         target_width=None,
         target_height=None,
         target_crs=None,
-        driver="GTiff",
         resampling=Resampling.bilinear,
         masked=False,
+        num_threads=1,
     ):
         if target_resolution is None and (
             target_width is None or target_height is None
@@ -32,211 +57,190 @@ class ReprojectRasterTask(EOTask):
         self.target_width = target_width
         self.target_height = target_height
         self.target_resolution = target_resolution
-        self.driver = driver
         self.resampling = resampling
         self.masked = masked
+        self.num_threads = num_threads
 
     def execute(self, eopatch: EOPatch):
+        feature_data = eopatch[self.feature]
         times = None
         # timeless features only have 3 dimensions
-        if len(eopatch[self.feature].shape) == 3:
-            height, width, channels = eopatch[self.feature].shape
+        if len(feature_data.shape) == 3:
+            height, width, channels = feature_data.shape
         else:
-            times, height, width, channels = eopatch[self.feature].shape
+            times, height, width, channels = feature_data.shape
 
-        dtype = eopatch[self.feature].dtype
         crs = rio.crs.CRS.from_epsg(eopatch.bbox.crs.epsg)
         transform = rio.transform.from_bounds(*eopatch.bbox, width, height)
-
-        agreed_bbox = None
-        single_frame = None
-        frames = []
-        repeats = 1 if times is None else times
         target_crs = self.target_crs if self.target_crs is not None else crs
-        for i in range(repeats):
-            with MemoryFile() as src_memfile:
-                with src_memfile.open(
-                    driver=self.driver,
-                    height=height,
-                    width=width,
-                    count=channels,
-                    dtype=dtype,
-                    crs=crs,
-                    transform=transform,
-                    masked=self.masked,
-                ) as src:
-
-                    for channel in range(channels):
-                        if times is None:
-                            src.write(
-                                eopatch[self.feature][:, :, channel],
-                                channel + 1,
-                            )
-                        else:
-                            src.write(
-                                eopatch[self.feature][i, :, :, channel],
-                                channel + 1,
-                            )
-
-                    target_transform, target_width, target_height = (
-                        rio.warp.calculate_default_transform(
-                            src.crs,
-                            target_crs,
-                            src.width,
-                            src.height,
-                            *src.bounds,
-                            dst_width=self.target_width,
-                            dst_height=self.target_height
-                        )
-                        if self.target_resolution is None
-                        else rio.warp.calculate_default_transform(
-                            src.crs,
-                            target_crs,
-                            src.width,
-                            src.height,
-                            *src.bounds,
-                            resolution=self.target_resolution
-                        )
-                    )
-                    kwargs = src.meta.copy()
-                    kwargs.update(
-                        {
-                            "crs": target_crs,
-                            "transform": target_transform,
-                            "width": target_width,
-                            "height": target_height,
-                        }
-                    )
 
-                    with MemoryFile() as dst_memfile:
-                        with dst_memfile.open(**kwargs) as dst:
-                            for i in range(1, src.count + 1):
-                                rio.warp.reproject(
-                                    source=rio.band(src, i),
-                                    destination=rio.band(dst, i),
-                                    src_transform=src.transform,
-                                    src_crs=src.crs,
-                                    dst_transform=target_transform,
-                                    dst_crs=target_crs,
-                                    resampling=self.resampling,
-                                    masked=self.masked,
-                                )
-
-                            if agreed_bbox is None:
-                                agreed_bbox = BBox(
-                                    dst.bounds,
-                                    crs=target_crs if type(target_crs) == str else target_crs.to_epsg()
-                                )
-
-                            if times is not None:
-                                frames.append(np.moveaxis(dst.read(), 0, -1))
-                            else:
-                                single_frame = np.moveaxis(dst.read(), 0, -1)
+        # the target grid is the same for all timestamps and channels
+        target_transform, target_width, target_height = (
+            rio.warp.calculate_default_transform(
+                crs,
+                target_crs,
+                width,
+                height,
+                *eopatch.bbox,
+                dst_width=self.target_width,
+                dst_height=self.target_height
+            )
+            if self.target_resolution is None
+            else rio.warp.calculate_default_transform(
+                crs,
+                target_crs,
+                width,
+                height,
+                *eopatch.bbox,
+                resolution=self.target_resolution
+            )
+        )
+
+        source = feature_to_band_stack(feature_data)
+        destination = np.zeros(
+            (source.shape[0], target_height, target_width),
+            dtype=feature_data.dtype,
+        )
+        rio.warp.reproject(
+            source=source,
+            destination=destination,
+            src_transform=transform,
+            src_crs=crs,
+            dst_transform=target_transform,
+            dst_crs=target_crs,
+            resampling=self.resampling,
+            num_threads=self.num_threads,
+            masked=self.masked,
+        )
+
+        agreed_bbox = BBox(
+            rio.transform.array_bounds(
+                target_height, target_width, target_transform
+            ),
+            crs=target_crs if type(target_crs) == str else target_crs.to_epsg()
+        )
 
         result_eopatch = eopatch.copy()
-        result_eopatch[self.feature] = (
-            np.stack(frames, axis=0) if times is not None else single_frame
+        result_eopatch[self.feature] = band_stack_to_feature(
+            destination, times, channels
         )
         result_eopatch.bbox = agreed_bbox
 
         return result_eopatch
 
 
+def get_dn_reflectance_factor_key(feature):
+    (_, feature_name) = feature
+    return f"{feature_name}_dn_reflectance_factor"
+
+
+def get_dn_reflectance_factor(eopatch: EOPatch, feature):
+    # features stored as digital numbers record the factor to divide by,
+    # features already holding reflectances have none
+    return eopatch.meta_info.get(get_dn_reflectance_factor_key(feature))
+
+
+def dn_to_reflectance(values, dn_reflectance_factor, out=None):
+    # dividing in single precision gives the same float32 values as going
+    # through a float64 temporary, as the division is correctly rounded
+    return np.divide(
+        values, np.float32(dn_reflectance_factor), out=out, dtype=np.float32
+    )
+
+
+def get_reflectance(eopatch: EOPatch, feature):
+    values = eopatch[feature]
+    dn_reflectance_factor = get_dn_reflectance_factor(eopatch, feature)
+    if dn_reflectance_factor is None:
+        return values
+
+    return dn_to_reflectance(values, dn_reflectance_factor)
+
+
+def is_pixel_aligned(window, tolerance=1e-6):
+    window_values = np.array(
+        [window.col_off, window.row_off, window.width, window.height]
+    )
+
+    return np.allclose(window_values, np.round(window_values), atol=tolerance)
+
+
 # clipping logic taken from https://github.com/rasterio/rasterio/blob/master/rasterio/rio/clip.py
 class ClipBoxTask(EOTask):
     def __init__(
         self,
         feature,
         target_bounds,
-        driver="GTiff",
-        resampling=Resampling.bilinear
+        resampling=Resampling.nearest,
     ):
         self.feature = feature
         self.target_bounds = target_bounds
-        self.driver = driver
         self.resampling = resampling
 
     def execute(self, eopatch: EOPatch):
+        feature_data = eopatch[self.feature]
         times = None
         # timeless features only have 3 dimensions
-        if len(eopatch[self.feature].shape) == 3:
-            height, width, channels = eopatch[self.feature].shape
+        if len(feature_data.shape) == 3:
+            height, width, channels = feature_data.shape
         else:
-            times, height, width, channels = eopatch[self.feature].shape
+            times, height, width, channels = feature_data.shape
 
-        dtype = eopatch[self.feature].dtype
         crs = rio.crs.CRS.from_epsg(eopatch.bbox.crs.epsg)
         transform = rio.transform.from_bounds(*eopatch.bbox, width, height)
 
-        agreed_bbox = None
-        single_frame = None
-        frames = []
-        repeats = 1 if times is None else times
-        for i in range(repeats):
-            with MemoryFile() as src_memfile:
-                with src_memfile.open(
-                    driver=self.driver,
-                    height=height,
-                    width=width,
-                    count=channels,
-                    dtype=dtype,
-                    crs=crs,
-                    transform=transform,
-                ) as src:
-
-                    for channel in range(channels):
-                        if times is None:
-                            src.write(
-                                eopatch[self.feature][:, :, channel],
-                                channel + 1,
-                            )
-                        else:
-                            src.write(
-                                eopatch[self.feature][i, :, :, channel],
-                                channel + 1,
-                            )
-
-                    target_bounds_window = src.window(*self.target_bounds)
-                    target_bounds_window = target_bounds_window.intersection(
-                        Window(0, 0, src.width, src.height)
-                    )
-                    out_window = target_bounds_window.round_lengths()
-                    out_height = int(out_window.height)
-                    out_width = int(out_window.width)
-
-                    kwargs = src.meta.copy()
-                    kwargs.update(
-                        {
-                            "crs": crs,
-                            "transform": src.window_transform(out_window),
-                            "width": out_width,
-                            "height": out_height,
-                        }
-                    )
+        target_bounds_window = rio.windows.from_bounds(
+            *self.target_bounds, transform=transform
+        )
+        target_bounds_window = target_bounds_window.intersection(
+            Window(0, 0, width, height)
+        )
 
-                    with MemoryFile() as dst_memfile:
-                        with dst_memfile.open(**kwargs) as dst:
-                            dst.write(
-                                src.read(
-                                    window=out_window,
-                                    out_shape=(src.count, out_height, out_width)
-                                )
-                            )
-
-                            if agreed_bbox is None:
-                                agreed_bbox = BBox(
-                                    dst.bounds, crs=crs.to_epsg()
-                                )
-
-                            if times is not None:
-                                frames.append(np.moveaxis(dst.read(), 0, -1))
-                            else:
-                                single_frame = np.moveaxis(dst.read(), 0, -1)
+        if is_pixel_aligned(target_bounds_window):
+            # the window lies on the pixel grid - the clipped feature is a
+            # plain slice (a view sharing memory with the source feature)
+            out_window = Window(
+                *[
+                    int(round(x)) for x in (
+                        target_bounds_window.col_off,
+                        target_bounds_window.row_off,
+                        target_bounds_window.width,
+                        target_bounds_window.height,
+                    )
+                ]
+            )
+            row_slice, col_slice = out_window.toslices()
+            clipped_data = feature_data[..., row_slice, col_slice, :]
+        else:
+            # sub-pixel offsets need to be resampled onto the shifted grid
+            out_window = target_bounds_window.round_lengths()
+            source = feature_to_band_stack(feature_data)
+            destination = np.zeros(
+                (source.shape[0], int(out_window.height), int(out_window.width)),
+                dtype=feature_data.dtype,
+            )
+            rio.warp.reproject(
+                source=source,
+                destination=destination,
+                src_transform=transform,
+                src_crs=crs,
+                dst_transform=rio.windows.transform(out_window, transform),
+                dst_crs=crs,
+                resampling=self.resampling,
+            )
+            clipped_data = band_stack_to_feature(destination, times, channels)
+
+        agreed_bbox = BBox(
+            rio.transform.array_bounds(
+                int(out_window.height),
+                int(out_window.width),
+                rio.windows.transform(out_window, transform),
+            ),
+            crs=crs.to_epsg(),
+        )
 
         result_eopatch = eopatch.copy()
-        result_eopatch[self.feature] = (
-            np.stack(frames, axis=0) if times is not None else single_frame
-        )
+        result_eopatch[self.feature] = clipped_data
         result_eopatch.bbox = agreed_bbox
 
         return result_eopatch
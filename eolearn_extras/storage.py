@@ -0,0 +1,102 @@
+import os
+
+import numpy as np
+from sentinelhub import MimeType
+from eolearn.core import EOPatch, EOTask, FeatureType, OverwritePermission
+from eolearn.core.eodata_io import FeatureIO, walk_filesystem
+from eolearn.core.utils.fs import get_filesystem
+
+
+def is_memory_mappable(path, filesystem):
+    # only uncompressed .npy files on a local filesystem can be mapped, EOPatch
+    # saves with compress_level=0 (the default) produce exactly those
+    return (
+        MimeType.NPY.matches_extension(path)
+        and filesystem.hassyspath(path)
+    )
+
+
+class MemoryMappedFeatureIO(FeatureIO):
+    def __init__(
+        self, feature_type: FeatureType, path, filesystem, mmap_mode="r"
+    ):
+        super().__init__(feature_type, path, filesystem)
+        self.mmap_mode = mmap_mode
+
+    def load(self):
+        if self.loaded_value is not None:
+            return self.loaded_value
+
+        if not is_memory_mappable(self.path, self.filesystem):
+            return super().load()
+
+        # the .npy header is padded to a multiple of 64 bytes, so the mapped
+        # data is aligned and pages are only read when pixels are accessed
+        self.loaded_value = np.load(
+            self.filesystem.getsyspath(self.path), mmap_mode=self.mmap_mode
+        )
+
+        return self.loaded_value
+
+
+def load_memory_mapped_eopatch(
+    path, features=..., mmap_mode="r", filesystem=None
+):
+    # raster features are opened as memory mapped arrays on first access,
+    # compressed or remote features fall back to regular (lazy) loading
+    if filesystem is None:
+        filesystem = get_filesystem(path, create=False)
+        path = "/"
+
+    eopatch = EOPatch()
+    for (feature_type, feature_name, feature_path) in walk_filesystem(
+        filesystem, path, features
+    ):
+        eopatch[(feature_type, feature_name)] = (
+            MemoryMappedFeatureIO(
+                feature_type, feature_path, filesystem, mmap_mode=mmap_mode
+            )
+            if feature_type.is_raster()
+            else FeatureIO(feature_type, feature_path, filesystem)
+        )
+
+    return eopatch
+
+
+def make_eopatch_memory_mappable(path):
+    # rewrites the compressed raster features of a saved EOPatch in place as
+    # uncompressed .npy files, one feature at a time to keep only a single
+    # feature in memory - the redundant .gz files are removed by the save
+    filesystem = get_filesystem(path, create=False)
+    compressed_features = [
+        (feature_type, feature_name)
+        for (feature_type, feature_name, feature_path) in walk_filesystem(
+            filesystem, "/"
+        )
+        if feature_type.is_raster()
+        and MimeType.GZIP.matches_extension(feature_path)
+    ]
+
+    for feature in compressed_features:
+        EOPatch.load(path, features=[feature]).save(
+            path,
+            features=[feature],
+            overwrite_permission=OverwritePermission.OVERWRITE_FEATURES,
+            compress_level=0,
+        )
+
+    return compressed_features
+
+
+class LoadMemoryMappedTask(EOTask):
+    def __init__(self, path, features=..., mmap_mode="r"):
+        self.path = path
+        self.features = features
+        self.mmap_mode = mmap_mode
+
+    def execute(self, *, eopatch_folder=""):
+        return load_memory_mapped_eopatch(
+            os.path.join(self.path, eopatch_folder),
+            features=self.features,
+            mmap_mode=self.mmap_mode,
+        )
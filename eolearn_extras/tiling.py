@@ -0,0 +1,104 @@
+from collections import namedtuple
+
+import numpy as np
+import rasterio as rio
+from rasterio.windows import Window
+from sentinelhub import BBox
+
+
+Tile = namedtuple("Tile", ["bbox", "shape", "window", "core_window"])
+
+
+def get_grid_shape(bbox: BBox, resolution):
+    return (
+        max(1, round((bbox.max_y - bbox.min_y) / resolution)),
+        max(1, round((bbox.max_x - bbox.min_x) / resolution)),
+    )
+
+
+def split_bbox_into_tiles(bbox: BBox, resolution, tile_size=1024, overlap=32):
+    if overlap < 0 or overlap >= tile_size:
+        raise ValueError("Overlap has to be in the range [0, tile_size)")
+
+    height, width = get_grid_shape(bbox, resolution)
+    grid_transform = rio.transform.from_bounds(*bbox, width, height)
+
+    tiles = []
+    for row_start in range(0, height, tile_size):
+        for col_start in range(0, width, tile_size):
+            row_stop = min(height, row_start + tile_size)
+            col_stop = min(width, col_start + tile_size)
+
+            # the core window is the part of the AOI grid a tile is
+            # responsible for, the overlap only serves as resampling and
+            # neighbourhood context and gets cut off again when mosaicking
+            core_window = Window.from_slices(
+                (row_start, row_stop), (col_start, col_stop)
+            )
+            window = Window.from_slices(
+                (max(0, row_start - overlap), min(height, row_stop + overlap)),
+                (max(0, col_start - overlap), min(width, col_stop + overlap)),
+            )
+            tile_shape = (int(window.height), int(window.width))
+            tile_bbox = BBox(
+                rio.transform.array_bounds(
+                    *tile_shape, rio.windows.transform(window, grid_transform)
+                ),
+                crs=bbox.crs,
+            )
+            tiles.append(Tile(tile_bbox, tile_shape, window, core_window))
+
+    return tiles
+
+
+def process_tiles(
+    bbox: BBox,
+    resolution,
+    process_tile,
+    tile_size=1024,
+    overlap=32,
+    dtype=np.float32,
+    fill_value=np.nan,
+    out=None,
+    log_callback=None,
+):
+    # process_tile receives the bbox and shape of a single tile and has to
+    # return a (height, width) or (height, width, 1) array for it - only one
+    # tile is held in memory at a time, the mosaic is written into `out`
+    # which can also be a np.memmap for AOIs which do not fit into RAM
+    tiles = split_bbox_into_tiles(
+        bbox, resolution, tile_size=tile_size, overlap=overlap
+    )
+    grid_shape = get_grid_shape(bbox, resolution)
+
+    if out is None:
+        out = np.full(grid_shape, fill_value, dtype=dtype)
+    elif out.shape[:2] != grid_shape:
+        raise ValueError(
+            f"Output shape {out.shape} does not match AOI grid {grid_shape}"
+        )
+
+    for index, tile in enumerate(tiles):
+        tile_result = np.asarray(process_tile(tile.bbox, tile.shape))
+        if tile_result.ndim == 3:
+            tile_result = tile_result[:, :, 0]
+
+        if tile_result.shape != tile.shape:
+            raise ValueError(
+                f"Tile result has shape {tile_result.shape} "
+                f"but tile shape is {tile.shape}"
+            )
+
+        core_row_offset = int(tile.core_window.row_off - tile.window.row_off)
+        core_col_offset = int(tile.core_window.col_off - tile.window.col_off)
+        core_height = int(tile.core_window.height)
+        core_width = int(tile.core_window.width)
+        out[tile.core_window.toslices()] = tile_result[
+            core_row_offset:core_row_offset + core_height,
+            core_col_offset:core_col_offset + core_width,
+        ]
+
+        if log_callback:
+            log_callback(f"Processed tile {index + 1}/{len(tiles)}.")
+
+    return out
@@ -1,3 +1,6 @@
+import math
+import weakref
+
 import numpy as np
 import pandas as pd
 
@@ -8,32 +11,183 @@ from mpl_toolkits.axes_grid1 import make_axes_locatable
 from eolearn.core import EOPatch
 import earthpy.plot as ep
 
+from eolearn_extras.raster import dn_to_reflectance, get_dn_reflectance_factor
+
 
 sentinel_2_true_color = [3, 2, 1]
 sentinel_2_false_color = [7, 3, 2]
 
+# rasters are rendered from an overview of at most this many pixels per side,
+# roughly the resolution of a figure on screen
+default_max_size = 2048
+
+
+def get_strided_sample(data, max_samples=2 ** 20):
+    # regular pixel grid of a (height, width, ...) raster, the result is a
+    # view so only the sampled rows are read from memory mapped features
+    height, width = data.shape[:2]
+    step = max(1, math.ceil(math.sqrt(height * width / max_samples)))
+
+    return data[::step, ::step]
+
+
+def get_stretch_limits(band_data, percentiles=(5, 95), max_samples=2 ** 20):
+    return np.percentile(
+        get_strided_sample(band_data, max_samples), percentiles
+    )
+
+
+def select_bands(data, bands=None):
+    # indexing with a list of bands copies, so it is only applied to the
+    # rows which are actually read
+    if bands is None or data.ndim == 2:
+        return data
+
+    return data[:, :, bands]
+
+
+def get_overview_factor(shape, max_size=default_max_size):
+    factor = 1
+    while max(shape[:2]) / factor > max_size:
+        factor *= 2
+
+    return factor
+
+
+def downsample(data, factor, bands=None, block_size=2 ** 22):
+    # block means over factor x factor pixels, the rows and columns which do
+    # not fill a whole block are cropped - strips of rows keep the float copy
+    # of the source small, e.g. for memory mapped features
+    height, width = data.shape[0] // factor, data.shape[1] // factor
+    band_shape = select_bands(data[:1, :1], bands).shape[2:]
+    level = np.empty((height, width) + band_shape, dtype=np.float32)
+    rows_per_strip = max(
+        1, block_size // max(1, width * factor ** 2 * level[0, 0].size)
+    )
+    for row in range(0, height, rows_per_strip):
+        row_end = min(height, row + rows_per_strip)
+        strip = select_bands(
+            data[row * factor:row_end * factor, :width * factor], bands
+        )
+        level[row:row_end] = strip.reshape(
+            (row_end - row, factor, width, factor) + band_shape
+        ).mean(axis=(1, 3), dtype=np.float32)
+
+    return level
+
+
+class OverviewPyramid:
+    def __init__(self):
+        # downsampled levels of one band selection by their power of two
+        # factor, the source is not referenced so the cache does not keep
+        # the raster alive
+        self.levels = {}
+
+    def get_level(self, data, factor, bands=None):
+        if factor == 1:
+            return select_bands(data, bands)
+
+        if factor not in self.levels:
+            # coarser levels are reduced from the finest cached level instead
+            # of the full resolution raster
+            source_factor = max(
+                [1] + [level for level in self.levels if level < factor]
+            )
+            self.levels[factor] = (
+                downsample(data, factor, bands)
+                if source_factor == 1
+                else downsample(
+                    self.levels[source_factor], factor // source_factor
+                )
+            )
+
+        return self.levels[factor]
+
+
+_overview_pyramids = {}
+
+
+def get_overview_pyramid(data, bands=None, time_index=None):
+    # pyramids are cached for as long as the raster itself is alive, e.g.
+    # the feature array of a loaded EOPatch - in place changes of its values
+    # are not noticed, clear_overview_cache() drops the stale levels
+    key = (
+        id(data), time_index, None if bands is None else tuple(bands)
+    )
+    entry = _overview_pyramids.get(key)
+    if entry is not None and entry[0]() is data:
+        return entry[1]
+
+    pyramid = OverviewPyramid()
+    _overview_pyramids[key] = (
+        weakref.ref(data, lambda _: _overview_pyramids.pop(key, None)),
+        pyramid,
+    )
+
+    return pyramid
+
+
+def clear_overview_cache():
+    _overview_pyramids.clear()
+
+
+def get_overview(data, bands=None, time_index=None, max_size=default_max_size):
+    factor = get_overview_factor(
+        data.shape[1:] if time_index is not None else data.shape, max_size
+    )
+    pyramid = get_overview_pyramid(data, bands, time_index)
+
+    return pyramid.get_level(
+        data if time_index is None else data[time_index], factor, bands
+    )
+
 
 def plot_eopatch(
-    eopatch: EOPatch, rgb_bands, feature, time_index=0, stretch=True, ax=None
+    eopatch: EOPatch,
+    rgb_bands,
+    feature,
+    time_index=0,
+    stretch=True,
+    ax=None,
+    max_size=default_max_size,
 ):
-    bands_at_timestamp = eopatch[feature][time_index, :, :, :]
-    _, _, bands = bands_at_timestamp.shape
-    single_bands = [bands_at_timestamp[:, :, x] for x in range(bands)]
+    # only the displayed bands are read, reduced to screen resolution and
+    # converted to reflectances
+    rgb_data = get_overview(
+        eopatch[feature], rgb_bands, time_index=time_index, max_size=max_size
+    )
+    dn_reflectance_factor = get_dn_reflectance_factor(eopatch, feature)
+    if dn_reflectance_factor is not None:
+        rgb_data = dn_to_reflectance(rgb_data, dn_reflectance_factor)
 
     return ep.plot_rgb(
-        np.stack(single_bands), rgb=rgb_bands, stretch=stretch, ax=ax
+        np.moveaxis(rgb_data, -1, 0), rgb=[0, 1, 2], stretch=stretch, ax=ax
     )
 
 
 def plot_ndarray_band(
-    band_data, stretch=True, figsize=(10, 10), cmap="gray", colorbar=True
+    band_data,
+    stretch=True,
+    figsize=(10, 10),
+    cmap="gray",
+    colorbar=True,
+    max_size=default_max_size,
 ):
     vmin = None
     vmax = None
     if stretch:
-        vmin, vmax = np.percentile(band_data, [5, 95])
+        vmin, vmax = get_stretch_limits(band_data, [5, 95])
     fig, ax = plt.subplots(1, 1, figsize=figsize)
-    im = ax.imshow(band_data, cmap=cmap, vmin=vmin, vmax=vmax)
+    im = ax.imshow(
+        get_overview(band_data, max_size=max_size),
+        cmap=cmap,
+        vmin=vmin,
+        vmax=vmax,
+        # keeps the axes in pixels of the full resolution raster
+        extent=(
+            -0.5, band_data.shape[1] - 0.5, band_data.shape[0] - 0.5, -0.5
+        ),
+    )
 
     if colorbar:
         divider = make_axes_locatable(ax)
@@ -52,11 +206,20 @@ def plot_single_band(
     figsize=(10, 10),
     cmap="gray",
     colorbar=True,
+    max_size=default_max_size,
 ):
-    if len(eopatch[feature].shape) > 3:
-        band_data = eopatch[feature][time_index, :, :, band_index]
-    else:
-        band_data = eopatch[feature][:, :, band_index]
+    # the overview is cached under the feature array, the stretch limits
+    # are computed from the overview then
+    band_data = get_overview(
+        eopatch[feature],
+        [band_index],
+        time_index=time_index if len(eopatch[feature].shape) > 3 else None,
+        max_size=max_size,
+    )[:, :, 0]
+
+    dn_reflectance_factor = get_dn_reflectance_factor(eopatch, feature)
+    if dn_reflectance_factor is not None:
+        band_data = dn_to_reflectance(band_data, dn_reflectance_factor)
 
     return plot_ndarray_band(
         band_data,
@@ -64,6 +227,7 @@ def plot_single_band(
         figsize=figsize,
         cmap=cmap,
         colorbar=colorbar,
+        max_size=max_size,
     )
 
 
@@ -79,6 +243,12 @@ def plot_band_histogram_rgb(eop, feature, mask_feature=None, ax=None, figsize=(8
         green_band = green_band[mask_index]
         blue_band = blue_band[mask_index]
 
+    dn_reflectance_factor = get_dn_reflectance_factor(eop, feature)
+    if dn_reflectance_factor is not None:
+        red_band = dn_to_reflectance(red_band, dn_reflectance_factor)
+        green_band = dn_to_reflectance(green_band, dn_reflectance_factor)
+        blue_band = dn_to_reflectance(blue_band, dn_reflectance_factor)
+
     if clip_value:
         red_band = red_band[red_band <= clip_value]
         green_band = green_band[green_band <= clip_value]
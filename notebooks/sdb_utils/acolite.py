@@ -4,19 +4,12 @@ import datetime
 import re
 
 import numpy as np
+import dask.array as da
 
-from eolearn.core import (
-    EOWorkflow,
-    linearly_connect_tasks,
-    OutputTask,
-    EOTask,
-    FeatureType,
-    MergeEOPatchesTask,
-    MergeFeatureTask,
-)
-from eolearn.io import ImportFromTiffTask
+from eolearn.core import EOPatch, EOTask
 
 import rasterio as rio
+from rasterio.enums import Resampling
 import eolearn_extras as eolx
 
 
@@ -42,44 +35,87 @@ def get_info_for_acolite_tif_path(acolite_tif_path):
     return reflectance_type, center_freq, datetime.datetime(int(year), int(month), int(day), int(hour), int(minute), int(second))
 
 
-def get_eopatch_for_acolite_band_tif(band_tif_path, reference_bbox, feature, target_resolution=(10, 10), log_callback=None):
-    reflectance_type, center_freq, ts = get_info_for_acolite_tif_path(band_tif_path)
-
-    feature_type, feature_name = feature
-    new_feature_name = f'{feature_name}_{reflectance_type}_{center_freq}'
-    feature = (feature_type, new_feature_name)
-
-    import_acolite_band = ImportFromTiffTask(feature, band_tif_path)
-    reproject_acolite_band = eolx.raster.ReprojectRasterTask(
-        feature,
-        target_crs=rio.crs.CRS.from_epsg(reference_bbox.crs.epsg),
-        target_resolution=target_resolution
+def read_acolite_bands_on_grid(
+    acolite_band_tifs,
+    reference_bbox,
+    target_shape,
+    feature_name,
+    resampling=Resampling.bilinear,
+    log_callback=None,
+):
+    height, width = target_shape
+    dst_crs = rio.crs.CRS.from_epsg(reference_bbox.crs.epsg)
+    dst_transform = rio.transform.from_bounds(*reference_bbox, width, height)
+
+    # bands are warped straight into one preallocated band sequential array,
+    # GDAL only reads the parts of each tif which cover the reference bbox
+    band_stack = np.zeros(
+        (len(acolite_band_tifs), height, width), dtype=np.float32
     )
-    clip_acolite_band = eolx.raster.ClipBoxTask(feature, target_bounds=reference_bbox)
-
-    acolite_band_output_label = 'acolite_band_output'
-    wf = EOWorkflow(
-        linearly_connect_tasks(
-            import_acolite_band,
-            reproject_acolite_band,
-            clip_acolite_band,
-            OutputTask(acolite_band_output_label)
-        )
+    overcorrection_info = {}
+    for band_index, band_tif_path in enumerate(acolite_band_tifs):
+        reflectance_type, center_freq, _ = get_info_for_acolite_tif_path(band_tif_path)
+        band_name = f'{feature_name}_{reflectance_type}_{center_freq}'
+
+        with rio.open(band_tif_path) as src:
+            rio.warp.reproject(
+                source=rio.band(src, 1),
+                destination=band_stack[band_index],
+                dst_transform=dst_transform,
+                dst_crs=dst_crs,
+                resampling=resampling,
+            )
+
+        # TODO: think about a better fix for wrong atmospheric correction
+        overcorrected_index = band_stack[band_index] < 0
+        number_of_overcorrected_pixels = np.count_nonzero(overcorrected_index)
+        if number_of_overcorrected_pixels > 0:
+            if log_callback:
+                msg = f'Feature {band_name} had {number_of_overcorrected_pixels} overcorrected pixels. Setting to 0.'
+                log_callback(msg)
+            band_stack[band_index][overcorrected_index] = 0
+
+        overcorrection_info[band_name] = number_of_overcorrected_pixels
+
+    band_data = eolx.raster.band_stack_to_feature(
+        band_stack, times=1, channels=len(acolite_band_tifs)
     )
 
-    acolite_band_patch = wf.execute().outputs[acolite_band_output_label]
-    acolite_band_patch.timestamp = [ts]
+    return band_data, overcorrection_info
 
+
+def construct_lazy_acolite_eopatch(
+    acolite_band_tifs,
+    reference_bbox,
+    feature,
+    target_shape=None,
+    target_resolution=(10, 10),
+    chunks=1024,
+):
+    _, _, ts = get_info_for_acolite_tif_path(acolite_band_tifs[0])
+    resolution, _ = target_resolution
+
+    _, band_data = eolx.io.construct_lazy_band_data(
+        [os.path.abspath(x) for x in acolite_band_tifs],
+        reference_bbox,
+        target_shape=target_shape,
+        target_resolution=resolution,
+        use_overviews=False,
+        chunks=chunks,
+        driver='GTiff',
+    )
     # TODO: think about a better fix for wrong atmospheric correction
-    number_of_overcorrected_pixels = np.sum(acolite_band_patch[feature] < 0)
-    if number_of_overcorrected_pixels > 0:
-        if log_callback:
-            _, f_name = feature
-            msg = f'Feature {f_name} had {number_of_overcorrected_pixels} overcorrected pixels. Setting to 0.'
-            log_callback(msg)
-        acolite_band_patch[feature][acolite_band_patch[feature] < 0] = 0
+    band_data = da.where(band_data < 0, 0, band_data)
+
+    feature_type, _ = feature
+    acolite_eop = EOPatch()
+    acolite_eop.bbox = reference_bbox
+    acolite_eop.timestamp = [ts]
+    acolite_eop[feature] = eolx.io.make_lazy_feature(feature_type, band_data)
+    # counting overcorrected pixels would need a full pass over the data
+    acolite_eop.meta_info['acolite_overcorrection_info'] = None
 
-    return new_feature_name, number_of_overcorrected_pixels, acolite_band_patch
+    return acolite_eop
 
 
 class ReadAcoliteProduct(EOTask):
@@ -90,7 +126,11 @@ class ReadAcoliteProduct(EOTask):
         acolite_product='L2R',
         reflectance_type='rhos',
         target_resolution=(10, 10),
-        log_callback=None
+        log_callback=None,
+        lazy=False,
+        chunks=1024,
+        target_shape=None,
+        resampling=Resampling.bilinear,
     ):
         self.reference_bbox = reference_bbox
         self.acolite_product = acolite_product
@@ -98,6 +138,10 @@ class ReadAcoliteProduct(EOTask):
         self.feature = feature
         self.target_resolution = target_resolution
         self.log_callback = log_callback
+        self.lazy = lazy
+        self.chunks = chunks
+        self.target_shape = target_shape
+        self.resampling = resampling
 
     def execute(self, acolite_product_folder):
         acolite_band_tifs = get_acolite_band_tif_paths(
@@ -105,38 +149,43 @@ class ReadAcoliteProduct(EOTask):
             product_type=self.acolite_product,
             reflectance_type=self.reflectance_type,
         )
-
-        acolite_image_band_evaluations = [
-            get_eopatch_for_acolite_band_tif(
-                os.path.abspath(x),
+        if len(acolite_band_tifs) < 1:
+            raise ValueError(
+                f'No {self.acolite_product} {self.reflectance_type} bands '
+                f'found in {acolite_product_folder}'
+            )
+
+        if self.lazy:
+            return construct_lazy_acolite_eopatch(
+                acolite_band_tifs,
                 self.reference_bbox,
                 self.feature,
+                target_shape=self.target_shape,
                 target_resolution=self.target_resolution,
-                log_callback=self.log_callback,
-            ) for x in acolite_band_tifs
-        ]
-        acolite_image_bands = [band for (_, _, band) in acolite_image_band_evaluations]
-
-        merge_acolite_bands = MergeEOPatchesTask()
-        acolite_eop = merge_acolite_bands.execute(*acolite_image_bands)
-
-        feature_type, feature_name = self.feature
-        merge_band_data = MergeFeatureTask(
-            [(feature_type, x) for x in sorted(acolite_eop.get_features()[(FeatureType.DATA)], key=lambda x: int(x.split('_')[-1]))],
-            self.feature
+                chunks=self.chunks,
+            )
+
+        resolution, _ = self.target_resolution
+        target_shape = (
+            eolx.tiling.get_grid_shape(self.reference_bbox, resolution)
+            if self.target_shape is None
+            else self.target_shape
         )
-        merge_band_data.execute(acolite_eop)
-
-        keys_to_delete = [x for x in acolite_eop[feature_type].keys() if x != feature_name]
-        for key in keys_to_delete:
-            del acolite_eop[(feature_type, key)]
-
-        overcorrection_info = dict(
-            [
-                (band_name, number_of_overcorrected_pixels) for
-                (band_name, number_of_overcorrected_pixels, _) in
-                acolite_image_band_evaluations]
+        _, feature_name = self.feature
+        band_data, overcorrection_info = read_acolite_bands_on_grid(
+            [os.path.abspath(x) for x in acolite_band_tifs],
+            self.reference_bbox,
+            target_shape,
+            feature_name,
+            resampling=self.resampling,
+            log_callback=self.log_callback,
         )
+        _, _, ts = get_info_for_acolite_tif_path(acolite_band_tifs[0])
+
+        acolite_eop = EOPatch()
+        acolite_eop.bbox = self.reference_bbox
+        acolite_eop.timestamp = [ts]
+        acolite_eop[self.feature] = band_data
         acolite_eop.meta_info['acolite_overcorrection_info'] = overcorrection_info
 
         return acolite_eop
@@ -0,0 +1,269 @@
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+
+from sdb_utils.ml_utils import get_predict_kwargs, get_thread_split
+
+
+def predict_in_blocks(
+    model, X, block_size=2 ** 20, max_workers=None, **predict_kwargs
+):
+    # same block wise threaded prediction as create_sdb_estimation, the
+    # predict calls of LightGBM and statsmodels release the GIL
+    y_hat = np.empty(len(X), dtype=np.float32)
+    block_starts = range(0, len(X), block_size)
+    workers, num_threads = get_thread_split(max_workers, len(block_starts))
+    predict_kwargs = get_predict_kwargs(model, num_threads, predict_kwargs)
+
+    def predict_block(start):
+        y_hat[start:start + block_size] = model.predict(
+            X[start:start + block_size], **predict_kwargs
+        )
+
+    if workers == 1:
+        for start in block_starts:
+            predict_block(start)
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(predict_block, block_starts))
+
+    return y_hat
+
+
+def rmse_loss(y, y_hat):
+    return np.sqrt(np.mean(np.square(y_hat - y, dtype=np.float64)))
+
+
+def get_performance(y, y_hat):
+    y = np.asarray(y, dtype=np.float64)
+    residuals = np.asarray(y_hat, dtype=np.float64) - y
+    mse = np.mean(np.square(residuals))
+    total = np.sum(np.square(y - np.mean(y)))
+
+    return {
+        'mse': mse,
+        'rmse': np.sqrt(mse),
+        'r2': 1 - mse * len(residuals) / total,
+        'mae': np.mean(np.abs(residuals)),
+        'mad': np.median(np.abs(residuals)),
+    }
+
+
+class ModelEvaluation:
+    def __init__(
+        self,
+        model,
+        X,
+        y,
+        label=None,
+        predictions=None,
+        block_size=2 ** 20,
+        max_workers=None,
+        feature_names=None,
+        **predict_kwargs,
+    ):
+        # predictions are computed once on first use and shared by all
+        # metrics, already known predictions (e.g. the values returned by
+        # create_sdb_estimation) can be passed in directly - feature_names
+        # default to the columns of a DataFrame X
+        if feature_names is None and hasattr(X, 'columns'):
+            feature_names = [str(column) for column in X.columns]
+        self.model = model
+        self.X = X
+        self.y = np.asarray(y)
+        self.label = label
+        self.feature_names = feature_names
+        self.block_size = block_size
+        self.max_workers = max_workers
+        self.predict_kwargs = predict_kwargs
+        self._predictions = predictions
+
+    def predict(self, X):
+        return predict_in_blocks(
+            self.model,
+            X,
+            block_size=self.block_size,
+            max_workers=self.max_workers,
+            **self.predict_kwargs,
+        )
+
+    @property
+    def predictions(self):
+        if self._predictions is None:
+            self._predictions = self.predict(self.X)
+
+        return self._predictions
+
+    @property
+    def residuals(self):
+        return self.predictions - self.y
+
+    def performance(self):
+        return get_performance(self.y, self.predictions)
+
+    def reverse_cumulative_residuals(self, n_points=1000):
+        # fraction of pixels with an absolute residual of at least the given
+        # value, evaluated on n_points quantiles instead of every pixel
+        abs_residuals = np.sort(np.abs(self.residuals))
+        positions = np.linspace(
+            0, len(abs_residuals) - 1, min(n_points, len(abs_residuals))
+        ).astype(np.int64)
+
+        return pd.DataFrame({
+            'abs_residual': abs_residuals[positions],
+            'fraction': 1 - positions / len(abs_residuals),
+        })
+
+    def depth_binned_errors(self, depth_bins):
+        # error statistics per depth range of the reference depth, pixels
+        # outside of the bins are ignored
+        depth_bins = np.asarray(depth_bins)
+        bin_count = len(depth_bins) - 1
+        # the last bin also includes its upper edge, like the strata of
+        # eolx.ml_util.sample_depth_stratified_pixels
+        bins = np.digitize(self.y, depth_bins) - 1
+        bins[self.y == depth_bins[-1]] = bin_count - 1
+        valid = (bins >= 0) & (bins < bin_count)
+        bins = bins[valid]
+        residuals = self.residuals[valid].astype(np.float64)
+
+        count = np.bincount(bins, minlength=bin_count)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            bias = np.bincount(bins, residuals, bin_count) / count
+            mse = np.bincount(bins, residuals ** 2, bin_count) / count
+            mae = np.bincount(bins, np.abs(residuals), bin_count) / count
+
+        return pd.DataFrame({
+            'depth_from': depth_bins[:-1],
+            'depth_to': depth_bins[1:],
+            'count': count,
+            'bias': bias,
+            'rmse': np.sqrt(mse),
+            'mae': mae,
+            'std': np.sqrt(mse - bias ** 2),
+        })
+
+    def permutation_importance(
+        self,
+        n_permutations=10,
+        sample_size=100000,
+        loss_fn=rmse_loss,
+        batch_size=2 ** 20,
+        max_workers=None,
+        seed=42,
+    ):
+        # the loss increase when a single variable is permuted - several
+        # permuted copies of the sample are stacked into one predict call and
+        # the batches are predicted side by side in threads
+        rng = np.random.default_rng(seed)
+        if sample_size is not None and sample_size < len(self.y):
+            sample = np.sort(
+                rng.choice(len(self.y), sample_size, replace=False)
+            )
+            X = (
+                self.X.iloc[sample] if hasattr(self.X, 'iloc')
+                else self.X[sample]
+            )
+            y = self.y[sample]
+            y_hat = self.predictions[sample]
+        else:
+            X, y, y_hat = self.X, self.y, self.predictions
+
+        X = np.asarray(X)
+        n_rows, n_variables = X.shape
+        permutations = [rng.permutation(n_rows) for _ in range(n_permutations)]
+
+        jobs = [
+            (variable, permutation)
+            for variable in range(n_variables)
+            for permutation in range(n_permutations)
+        ]
+        jobs_per_batch = max(1, batch_size // n_rows)
+        batches = [
+            jobs[start:start + jobs_per_batch]
+            for start in range(0, len(jobs), jobs_per_batch)
+        ]
+        workers, num_threads = get_thread_split(max_workers, len(batches))
+        predict_kwargs = get_predict_kwargs(
+            self.model, num_threads, self.predict_kwargs
+        )
+
+        def predict_batch(batch):
+            X_batch = np.empty(
+                (len(batch) * n_rows, n_variables), dtype=X.dtype
+            )
+            for i, (variable, permutation) in enumerate(batch):
+                X_part = X_batch[i * n_rows:(i + 1) * n_rows]
+                X_part[...] = X
+                X_part[:, variable] = X[permutations[permutation], variable]
+
+            y_hat_batch = self.model.predict(X_batch, **predict_kwargs)
+            return [
+                loss_fn(y, y_hat_batch[i * n_rows:(i + 1) * n_rows])
+                for i in range(len(batch))
+            ]
+
+        if workers == 1:
+            batch_losses = [predict_batch(batch) for batch in batches]
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                batch_losses = list(executor.map(predict_batch, batches))
+
+        losses = np.reshape(
+            np.concatenate(batch_losses), (n_variables, n_permutations)
+        )
+        full_model_loss = loss_fn(y, y_hat)
+        baseline_loss = np.mean([
+            loss_fn(y[permutation], y_hat) for permutation in permutations
+        ])
+
+        # named like the variables of dalex model_parts
+        feature_names = (
+            [str(variable) for variable in range(n_variables)]
+            if self.feature_names is None else list(self.feature_names)
+        )
+        if len(feature_names) != n_variables:
+            raise ValueError(
+                f'{len(feature_names)} feature names given for '
+                f'{n_variables} variables'
+            )
+        importance = pd.DataFrame({
+            'variable': feature_names,
+            'dropout_loss': losses.mean(axis=1),
+            'dropout_loss_std': losses.std(axis=1),
+        }).sort_values('dropout_loss', ascending=False, ignore_index=True)
+        importance['label'] = self.label
+
+        return pd.concat(
+            [
+                pd.DataFrame({
+                    'variable': ['_full_model_', '_baseline_'],
+                    'dropout_loss': [full_model_loss, baseline_loss],
+                    'dropout_loss_std': [0.0, 0.0],
+                    'label': [self.label, self.label],
+                }),
+                importance,
+            ],
+            ignore_index=True,
+        )
+
+
+def compare_performance(evaluations):
+    # one row per evaluation like the concatenated dalex model_performance
+    # results, e.g. for all products of all AOIs
+    return pd.DataFrame(
+        [evaluation.performance() for evaluation in evaluations],
+        index=[evaluation.label for evaluation in evaluations],
+    )
+
+
+def compare_depth_binned_errors(evaluations, depth_bins):
+    return pd.concat(
+        [
+            evaluation.depth_binned_errors(depth_bins).assign(
+                label=evaluation.label
+            )
+            for evaluation in evaluations
+        ],
+        ignore_index=True,
+    )
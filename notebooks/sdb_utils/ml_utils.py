@@ -1,9 +1,15 @@
 import os
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from enum import IntEnum
 import numpy as np
 from eolearn.core import FeatureType
+import lightgbm
 import optuna.integration.lightgbm as lgb
 
+import eolearn_extras as eolx
+
 
 class SplitType(IntEnum):
     Train=1,
@@ -12,51 +18,331 @@ class SplitType(IntEnum):
     All=4
 
 
+def get_split_feature(
+    split_type: SplitType,
+    data_mask_feature=(FeatureType.MASK_TIMELESS, 'bathy_data_mask'),
+):
+    if split_type == SplitType.Train:
+        return (FeatureType.MASK_TIMELESS, 'train_split_valid')
+    elif split_type == SplitType.Test:
+        return (FeatureType.MASK_TIMELESS, 'test_split_valid')
+    elif split_type == SplitType.Validation:
+        return (FeatureType.MASK_TIMELESS, 'validation_split_valid')
+    elif split_type == SplitType.All:
+        return data_mask_feature
+
+    raise ValueError(f'Split type {split_type} not supported')
+
+
+split_names = {
+    SplitType.Train: 'train',
+    SplitType.Test: 'test',
+    SplitType.Validation: 'validation',
+}
+
+
+def get_split_mask(
+    eop,
+    split_type: SplitType,
+    data_mask_feature=(FeatureType.MASK_TIMELESS, 'bathy_data_mask'),
+    split_labels_feature=(FeatureType.MASK_TIMELESS, 'split_labels'),
+):
+    split_feature = get_split_feature(split_type, data_mask_feature)
+    if split_feature in eop:
+        return eop[split_feature][:, :, 0] == 1
+
+    # AddValidTrainTestMasks only keeps the compact label raster unless it
+    # is asked for the per split masks
+    split_label = eolx.ml_util.get_split_label_values(eop)[
+        split_names[split_type]
+    ]
+    return eop[split_labels_feature][:, :, 0] == split_label
+
+
+def gather_pixels(
+    data,
+    pixel_indices,
+    out=None,
+    dtype=np.float32,
+    dn_reflectance_factor=None,
+):
+    # data is either a (times, height, width, bands) feature of which the
+    # first timestamp is used or a timeless (height, width, bands) feature
+    frame = data[0] if data.ndim == 4 else data
+    height, width, bands = frame.shape
+
+    # the take below clips instead of raising to write into out without a
+    # temporary copy, so indices outside of the frame are rejected here
+    if len(pixel_indices) > 0 and (
+        pixel_indices.min() < 0 or pixel_indices.max() >= height * width
+    ):
+        raise IndexError(
+            f'Pixel indices must be within [0, {height * width}) for a '
+            f'{height}x{width} frame'
+        )
+
+    if out is None:
+        out = np.empty((len(pixel_indices), bands), dtype=dtype)
+    elif out.shape != (len(pixel_indices), bands):
+        raise ValueError(
+            f'Output buffer has shape {out.shape} but '
+            f'{(len(pixel_indices), bands)} is required'
+        )
+
+    if frame.flags.c_contiguous:
+        # pixel interleaved data - all bands are gathered with one take
+        pixels = frame.reshape(height * width, bands)
+        if pixels.dtype == out.dtype:
+            np.take(pixels, pixel_indices, axis=0, out=out, mode='clip')
+        else:
+            out[...] = np.take(pixels, pixel_indices, axis=0)
+    else:
+        # band sequential views (e.g. streamed Acolite products) are
+        # gathered band by band to avoid copying the whole raster
+        rows, cols = np.unravel_index(pixel_indices, (height, width))
+        for band in range(bands):
+            out[:, band] = frame[rows, cols, band]
+
+    # digital numbers are only converted for the gathered pixels
+    if dn_reflectance_factor is not None:
+        eolx.raster.dn_to_reflectance(out, dn_reflectance_factor, out=out)
+
+    return out
+
+
+class PixelFeatureExtractor:
+    def __init__(
+        self,
+        eop,
+        label_feature=(FeatureType.DATA_TIMELESS, 'bathy_data'),
+        data_mask_feature=(FeatureType.MASK_TIMELESS, 'bathy_data_mask'),
+        split_samples=None,
+    ):
+        # split_samples maps a split type to the name of a sample drawn with
+        # eolx.ml_util.AddDepthStratifiedSample, which then replaces the split
+        self.eop = eop
+        self.label_feature = label_feature
+        self.data_mask_feature = data_mask_feature
+        self.split_samples = {} if split_samples is None else split_samples
+        self.split_indices = {}
+
+    def get_split_indices(self, split_type: SplitType):
+        # flat pixel indices are computed once per split and reused for every
+        # data feature and label extracted afterwards
+        if split_type in self.split_samples:
+            return self.eop[
+                eolx.ml_util.get_split_indices_feature(
+                    self.split_samples[split_type]
+                )
+            ]
+
+        if split_type not in self.split_indices:
+            indices_feature = (
+                eolx.ml_util.get_split_indices_feature(split_names[split_type])
+                if split_type in split_names else None
+            )
+            if indices_feature is not None and indices_feature in self.eop:
+                self.split_indices[split_type] = self.eop[indices_feature]
+            else:
+                self.split_indices[split_type] = np.flatnonzero(
+                    get_split_mask(self.eop, split_type, self.data_mask_feature)
+                )
+
+        return self.split_indices[split_type]
+
+    def get_X(self, split_type: SplitType, data_feature, out=None, dtype=np.float32):
+        return gather_pixels(
+            self.eop[data_feature],
+            self.get_split_indices(split_type),
+            out=out,
+            dtype=dtype,
+            dn_reflectance_factor=eolx.raster.get_dn_reflectance_factor(
+                self.eop, data_feature
+            ),
+        )
+
+    def get_y(self, split_type: SplitType):
+        label_data = self.eop[self.label_feature]
+        return gather_pixels(
+            label_data,
+            self.get_split_indices(split_type),
+            dtype=label_data.dtype,
+        )[:, 0]
+
+    def get_X_y(self, split_type: SplitType, data_feature, out=None, dtype=np.float32):
+        X = self.get_X(split_type, data_feature, out=out, dtype=dtype)
+        y = self.get_y(split_type)
+
+        return X, y
+
+    def get_X_y_for_all_splits(self, data_feature, split_types=None, dtype=np.float32):
+        if split_types is None:
+            split_types = [SplitType.Train, SplitType.Test, SplitType.All]
+            if (self.eop.meta_info.get('validation_count', 0) or 0) > 0:
+                split_types.insert(1, SplitType.Validation)
+
+        return dict(
+            (split_type, self.get_X_y(split_type, data_feature, dtype=dtype))
+            for split_type in split_types
+        )
+
+
 def get_X_y_for_split(eop,
     split_type: SplitType,
     data_feature,
     label_feature,
     data_mask_feature=(FeatureType.MASK_TIMELESS, 'bathy_data_mask'),
+    out=None,
+    sample_name=None,
 ):
-    # only supporting data with time dimension for now
-    _, _, _, bands = eop[data_feature].shape
-    traincount = eop.meta_info['train_count']
-    testcount = eop.meta_info['test_count']
-    validationcount = eop.meta_info['validation_count']
+    extractor = PixelFeatureExtractor(
+        eop,
+        label_feature=label_feature,
+        data_mask_feature=data_mask_feature,
+        split_samples=None if sample_name is None else {split_type: sample_name},
+    )
 
-    bathy_pixels = np.sum(eop[data_mask_feature] == 1)
+    return extractor.get_X_y(split_type, data_feature, out=out)
+
+
+def get_thread_split(max_workers, task_count):
+    # the number of tasks run side by side and the OpenMP threads of each
+    # LightGBM predict call, so that together they use every core once
+    cpu_count = os.cpu_count() or 1
+    workers = cpu_count if max_workers is None else max_workers
+    workers = max(1, min(task_count, workers))
+
+    return workers, max(1, cpu_count // workers)
 
-    if split_type == SplitType.Train:
-        split_feature = (FeatureType.MASK_TIMELESS, 'train_split_valid')
-        sample_count = traincount
-    elif split_type == SplitType.Test:
-        split_feature = (FeatureType.MASK_TIMELESS, 'test_split_valid')
-        sample_count = testcount
-    elif split_type == SplitType.Validation:
-        split_feature = (FeatureType.MASK_TIMELESS, 'validation_split_valid')
-        sample_count = validationcount
-    elif split_type == SplitType.All:
-        split_feature = data_mask_feature
-        sample_count = bathy_pixels
 
-    split_index = np.repeat(eop[split_feature], repeats=bands, axis=-1)
-    X = np.reshape(eop[data_feature][0,:,:,:][split_index == 1], (sample_count, bands))
-    y = eop[label_feature][eop[split_feature] == 1]
+def get_predict_kwargs(model, num_threads, predict_kwargs):
+    # only LightGBM models take num_threads, e.g. statsmodels results do not
+    if 'num_threads' in predict_kwargs or not isinstance(
+        model, (lightgbm.Booster, lightgbm.LGBMModel)
+    ):
+        return predict_kwargs
 
-    return X, y
+    return dict(predict_kwargs, num_threads=num_threads)
 
 
 def create_sdb_estimation(
     eop,
     model,
-    X_all,
-    mask_feature=(FeatureType.MASK_TIMELESS, 'bathy_data_mask')
+    X_all=None,
+    mask_feature=(FeatureType.MASK_TIMELESS, 'bathy_data_mask'),
+    data_feature=None,
+    feature_fn=None,
+    block_size=2 ** 20,
+    max_workers=None,
+    out=None,
+    **predict_kwargs,
+):
+    # the estimation is predicted in blocks of pixels, either taken from a
+    # precomputed X_all or gathered straight from data_feature so that the
+    # full pixel matrix never has to exist - feature_fn can turn a block of
+    # band values into model inputs, e.g. the Stumpf ratio plus a constant
+    if (X_all is None) == (data_feature is None):
+        raise ValueError('Either X_all or data_feature has to be given')
+
+    mask = eop[mask_feature]
+    if out is None:
+        out = np.zeros(mask.shape, dtype=np.float32)
+    elif out.shape != mask.shape or not out.flags.c_contiguous:
+        raise ValueError(
+            f'Output raster has to be a contiguous array of shape {mask.shape}'
+        )
+    out_flat = out.reshape(-1)
+
+    extractor = PixelFeatureExtractor(eop, data_mask_feature=mask_feature)
+    pixel_indices = extractor.get_split_indices(SplitType.All)
+    data = None if data_feature is None else eop[data_feature]
+    dn_reflectance_factor = (
+        None if data_feature is None
+        else eolx.raster.get_dn_reflectance_factor(eop, data_feature)
+    )
+
+    def predict_block(start):
+        block_indices = pixel_indices[start:start + block_size]
+        X_block = (
+            X_all[start:start + block_size] if data is None
+            else gather_pixels(
+                data,
+                block_indices,
+                dn_reflectance_factor=dn_reflectance_factor,
+            )
+        )
+        if feature_fn is not None:
+            X_block = feature_fn(X_block)
+
+        out_flat[block_indices] = model.predict(X_block, **predict_kwargs)
+
+    # the blocks write to disjoint pixels, so the heavy predict calls of
+    # LightGBM and statsmodels can run side by side in threads - the cores
+    # are split between the threads and the OpenMP threads of LightGBM
+    block_starts = range(0, len(pixel_indices), block_size)
+    workers, num_threads = get_thread_split(max_workers, len(block_starts))
+    predict_kwargs = get_predict_kwargs(model, num_threads, predict_kwargs)
+    if workers == 1:
+        for start in block_starts:
+            predict_block(start)
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(predict_block, block_starts))
+
+    y_hat_all = out_flat[pixel_indices]
+
+    return y_hat_all, out
+
+
+def create_tiled_sdb_estimation(
+    sentinel_archive,
+    model,
+    bbox,
+    target_resolution=10,
+    tile_size=1024,
+    overlap=32,
+    valid_mask_fn=None,
+    out=None,
+    log_callback=None,
+    **read_kwargs,
 ):
-    y_hat_all = model.predict(X_all)
-    sdb_estimation = np.zeros(eop[mask_feature].shape)
-    sdb_estimation[eop[mask_feature] == 1] = y_hat_all
+    _, level, _ = eolx.io.extract_meta_from_path(sentinel_archive)
+    data_feature = (FeatureType.DATA, f'{level}_data')
+
+    def predict_tile(tile_bbox, tile_shape):
+        tile_eop = eolx.io.construct_eopatch_from_sentinel_archive(
+            sentinel_archive,
+            bbox=tile_bbox,
+            target_shape=tile_shape,
+            target_resolution=target_resolution,
+            windowed_read=True,
+            **read_kwargs,
+        )
+        tile_data = eolx.raster.get_reflectance(tile_eop, data_feature)
+        _, _, _, bands = tile_data.shape
+        X_tile = tile_data[0].reshape(-1, bands)
+
+        # valid_mask_fn can restrict the estimation to e.g. water pixels
+        valid_index = (
+            np.ones(tile_shape, dtype=bool) if valid_mask_fn is None
+            else np.squeeze(valid_mask_fn(tile_eop) == 1)
+        ).ravel()
+
+        sdb_tile = np.full(tile_shape[0] * tile_shape[1], np.nan, dtype=np.float32)
+        if np.any(valid_index):
+            sdb_tile[valid_index] = model.predict(X_tile[valid_index])
+
+        return sdb_tile.reshape(tile_shape)
 
-    return y_hat_all, sdb_estimation
+    return eolx.tiling.process_tiles(
+        bbox,
+        target_resolution,
+        predict_tile,
+        tile_size=tile_size,
+        overlap=overlap,
+        out=out,
+        log_callback=log_callback,
+    )
 
 
 def get_masked_map(eop, data_feature, mask_feature):
@@ -67,34 +353,120 @@ def get_masked_map(eop, data_feature, mask_feature):
     return masked_map
 
 
-def create_train_val_set(eop, data_feature):
-    X_train, y_train = get_X_y_for_split(
-        eop,
-        split_type=SplitType.Train,
-        data_feature=data_feature,
-        label_feature=(FeatureType.DATA_TIMELESS, 'bathy_data'),
+def update_hash_with_array(key_hash, array, block_size=2 ** 24):
+    # hashed in blocks of rows, so memory mapped or strided features are
+    # never copied as a whole
+    rows_per_block = max(1, block_size // max(1, array[:1].nbytes))
+    for row in range(0, len(array), rows_per_block):
+        key_hash.update(
+            np.ascontiguousarray(array[row:row + rows_per_block]).data
+        )
+
+
+def get_train_val_set_cache_key(
+    extractor: PixelFeatureExtractor, data_feature, dataset_params
+):
+    # the full data frame, labels and split indices are hashed, which is
+    # still cheap compared to binning the features
+    eop = extractor.eop
+    data = eop[data_feature]
+    frame = data[0] if data.ndim == 4 else data
+
+    key_hash = hashlib.sha256()
+    key_hash.update(
+        repr(
+            (
+                eop.bbox,
+                data_feature,
+                data.shape,
+                str(data.dtype),
+                eolx.raster.get_dn_reflectance_factor(eop, data_feature),
+                sorted(dataset_params.items()),
+            )
+        ).encode('utf-8')
     )
-    train_ds = lgb.Dataset(X_train, label=y_train)
+    for split_type in (SplitType.Train, SplitType.Validation):
+        key_hash.update(extractor.get_split_indices(split_type).tobytes())
+    update_hash_with_array(key_hash, frame)
+    update_hash_with_array(key_hash, eop[extractor.label_feature])
+
+    return key_hash.hexdigest()
+
+
+def load_train_val_set(train_path, val_path, dataset_params):
+    train_ds = lgb.Dataset(train_path, params=dataset_params)
+    val_ds = lgb.Dataset(val_path, reference=train_ds, params=dataset_params)
+
+    return train_ds, val_ds
+
 
-    X_val, y_val = get_X_y_for_split(
+def create_train_val_set(
+    eop,
+    data_feature,
+    cache_dir=None,
+    dataset_params=None,
+    train_sample_name=None,
+):
+    # the validation set reuses the bin mappers of the training set, with a
+    # cache_dir both constructed datasets are saved as LightGBM binaries and
+    # later calls skip the feature binning entirely - train_sample_name
+    # trains on a depth stratified sample instead of the whole train split
+    dataset_params = (
+        {'feature_pre_filter': False} if dataset_params is None
+        else dataset_params
+    )
+    extractor = PixelFeatureExtractor(
         eop,
-        split_type=SplitType.Validation,
-        data_feature=data_feature,
         label_feature=(FeatureType.DATA_TIMELESS, 'bathy_data'),
+        split_samples=(
+            None if train_sample_name is None
+            else {SplitType.Train: train_sample_name}
+        ),
     )
-    val_ds = lgb.Dataset(X_val, label=y_val)
 
+    if cache_dir is not None:
+        cache_path = os.path.join(
+            os.path.abspath(cache_dir),
+            get_train_val_set_cache_key(extractor, data_feature, dataset_params),
+        )
+        train_path = os.path.join(cache_path, 'train.bin')
+        val_path = os.path.join(cache_path, 'validation.bin')
+        if os.path.isfile(train_path) and os.path.isfile(val_path):
+            return load_train_val_set(train_path, val_path, dataset_params)
+
+    X_train, y_train = extractor.get_X_y(SplitType.Train, data_feature)
+    train_ds = lgb.Dataset(X_train, label=y_train, params=dataset_params)
+
+    X_val, y_val = extractor.get_X_y(SplitType.Validation, data_feature)
+    val_ds = lgb.Dataset(
+        X_val, label=y_val, reference=train_ds, params=dataset_params
+    )
+
+    if cache_dir is not None:
+        os.makedirs(cache_path, exist_ok=True)
+        # binaries are written under a temporary name first so that a
+        # concurrent run never picks up a partially written file
+        for (dataset, path) in ((train_ds, train_path), (val_ds, val_path)):
+            tmp_path = f'{path}.tmp-{os.getpid()}-{threading.get_ident()}'
+            dataset.save_binary(tmp_path)
+            os.replace(tmp_path, path)
+
+        # saving constructs the datasets and frees their raw data, which
+        # the tuner can not use anymore - the binaries are loaded instead
+        return load_train_val_set(train_path, val_path, dataset_params)
 
     return train_ds, val_ds
 
 
-def write_optuna_capture_to_logs(log_dir, capt):
+def write_optuna_capture_to_logs(log_dir, capt, name=None):
     ld_abs = os.path.abspath(log_dir)
     if not os.path.exists(ld_abs):
         os.makedirs(ld_abs)
 
-    stdout_path = os.path.join(ld_abs, 'optimization_stdout.txt')
-    stderr_path = os.path.join(ld_abs, 'optimization_stderr.txt')
+    # a name keeps the logs of several tuning runs apart
+    prefix = '' if name is None else f'{name}_'
+    stdout_path = os.path.join(ld_abs, f'{prefix}optimization_stdout.txt')
+    stderr_path = os.path.join(ld_abs, f'{prefix}optimization_stderr.txt')
 
     with open(stdout_path, 'w') as f:
         f.write(capt.stdout)
@@ -15,3 +15,12 @@ def return_product_paths_for_dt(l1c_products, l2a_products, acolite_products, dt
     acolite_path = return_first_path_for_date(acolite_products, dt)
 
     return l1c_path, l2a_path, acolite_path
+
+
+def return_product_paths_for_dt_from_catalog(catalog, dt: datetime.datetime, max_delta=datetime.timedelta(seconds=0), bbox=None):
+    # same lookup as return_product_paths_for_dt but served from the sqlite
+    # index of eolearn_extras.catalog.SceneCatalog
+    return tuple(
+        catalog.find_nearest_scene(level, dt, max_delta=max_delta, bbox=bbox).path
+        for level in ('L1C', 'L2A', 'ACOLITE')
+    )
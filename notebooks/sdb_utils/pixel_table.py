@@ -0,0 +1,243 @@
+import os
+import glob
+import json
+import shutil
+import numpy as np
+from eolearn.core import FeatureType
+
+import eolearn_extras as eolx
+from sdb_utils.ml_utils import (
+    PixelFeatureExtractor,
+    SplitType,
+    gather_pixels,
+    split_names,
+)
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+
+# the table is partitioned into split_label=<value> folders with the values
+# of eolx.ml_util.split_label_values, 0 holds valid pixels outside the splits
+partition_column = 'split_label'
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError('Pixel tables require pyarrow to be installed')
+
+
+def get_split_label(split_type: SplitType):
+    return eolx.ml_util.split_label_values[split_names[split_type]]
+
+
+def get_band_columns(eop, data_feature, band_names=None):
+    _, feature_name = data_feature
+    bands = eop[data_feature].shape[-1]
+    if band_names is None:
+        band_names = [str(band) for band in range(bands)]
+    elif len(band_names) != bands:
+        raise ValueError(
+            f'{feature_name} has {bands} bands but {len(band_names)} band '
+            'names were given'
+        )
+
+    return [f'{feature_name}_{band_name}' for band_name in band_names]
+
+
+def get_pixel_table_schema(feature_columns):
+    # the feature columns are kept in the schema metadata, so the band
+    # columns of a product can be selected without parsing column names
+    return pa.schema(
+        [('row', pa.int32()), ('col', pa.int32()), ('depth', pa.float32())]
+        + [
+            (column, pa.float32())
+            for columns in feature_columns.values()
+            for column in columns
+        ],
+        metadata={'feature_columns': json.dumps(feature_columns)},
+    )
+
+
+def prepare_pixel_table_path(output_path, overwrite=False):
+    # partitions of an earlier export would otherwise be read back together
+    # with the new ones, only a previous pixel table is ever removed
+    if not os.path.isdir(output_path) or not os.listdir(output_path):
+        os.makedirs(output_path, exist_ok=True)
+        return
+
+    partition_paths = glob.glob(
+        os.path.join(output_path, f'{partition_column}=*')
+    )
+    if len(partition_paths) != len(os.listdir(output_path)):
+        raise FileExistsError(f'{output_path} is not a pixel table')
+    if not overwrite:
+        raise FileExistsError(
+            f'{output_path} already holds a pixel table, pass overwrite=True '
+            'to replace it'
+        )
+
+    for partition_path in partition_paths:
+        shutil.rmtree(partition_path)
+
+
+def get_partition_indices(extractor: PixelFeatureExtractor, split_types):
+    partition_indices = dict(
+        (get_split_label(split_type), extractor.get_split_indices(split_type))
+        for split_type in split_types
+    )
+    unsplit_indices = np.setdiff1d(
+        extractor.get_split_indices(SplitType.All),
+        np.concatenate(list(partition_indices.values())),
+        assume_unique=True,
+    )
+    if len(unsplit_indices) > 0:
+        partition_indices[0] = unsplit_indices
+
+    return partition_indices
+
+
+def export_pixel_table(
+    eop,
+    output_path,
+    data_features,
+    label_feature=(FeatureType.DATA_TIMELESS, 'bathy_data'),
+    data_mask_feature=(FeatureType.MASK_TIMELESS, 'bathy_data_mask'),
+    split_types=None,
+    band_names=None,
+    block_size=2 ** 20,
+    overwrite=False,
+):
+    # every valid pixel becomes one row holding its position, depth and the
+    # bands of all data features - pixels are gathered in blocks, so only one
+    # block of the table is in memory at a time
+    _require_pyarrow()
+    band_names = {} if band_names is None else band_names
+
+    extractor = PixelFeatureExtractor(
+        eop, label_feature=label_feature, data_mask_feature=data_mask_feature
+    )
+    if split_types is None:
+        split_types = [SplitType.Train, SplitType.Test]
+        if (eop.meta_info.get('validation_count', 0) or 0) > 0:
+            split_types.insert(1, SplitType.Validation)
+
+    feature_columns = dict(
+        (
+            data_feature[1],
+            get_band_columns(eop, data_feature, band_names.get(data_feature)),
+        )
+        for data_feature in data_features
+    )
+    schema = get_pixel_table_schema(feature_columns)
+    height, width = eop[data_mask_feature].shape[:2]
+    dn_reflectance_factors = [
+        eolx.raster.get_dn_reflectance_factor(eop, data_feature)
+        for data_feature in data_features
+    ]
+
+    partition_indices = get_partition_indices(extractor, split_types)
+    prepare_pixel_table_path(output_path, overwrite=overwrite)
+    for split_label, pixel_indices in partition_indices.items():
+        partition_path = os.path.join(
+            output_path, f'{partition_column}={split_label}'
+        )
+        os.makedirs(partition_path, exist_ok=True)
+
+        with pq.ParquetWriter(
+            os.path.join(partition_path, 'part-0.parquet'), schema
+        ) as writer:
+            for start in range(0, len(pixel_indices), block_size):
+                block_indices = pixel_indices[start:start + block_size]
+                rows, cols = np.unravel_index(block_indices, (height, width))
+                depth = gather_pixels(
+                    eop[label_feature], block_indices, dtype=np.float32
+                )[:, 0]
+
+                columns = [rows.astype(np.int32), cols.astype(np.int32), depth]
+                for data_feature, dn_reflectance_factor in zip(
+                    data_features, dn_reflectance_factors
+                ):
+                    # band sequential layout makes every band column a
+                    # contiguous slice which arrow can take over without copy
+                    X_block = gather_pixels(
+                        eop[data_feature],
+                        block_indices,
+                        dn_reflectance_factor=dn_reflectance_factor,
+                    ).T.copy()
+                    columns.extend(X_block)
+
+                writer.write_table(
+                    pa.Table.from_arrays(columns, schema=schema)
+                )
+
+    return dict(
+        (split_label, len(pixel_indices))
+        for (split_label, pixel_indices) in partition_indices.items()
+    )
+
+
+def open_pixel_table(path):
+    _require_pyarrow()
+    return ds.dataset(
+        path,
+        format='parquet',
+        partitioning=ds.partitioning(
+            pa.schema([(partition_column, pa.uint8())]), flavor='hive'
+        ),
+    )
+
+
+def get_feature_columns(dataset, data_feature):
+    feature_columns = json.loads(
+        dataset.schema.metadata[b'feature_columns'].decode('utf-8')
+    )
+
+    return feature_columns[data_feature[1]]
+
+
+def _get_split_filter(split_type):
+    if split_type is None or split_type == SplitType.All:
+        return None
+
+    return ds.field(partition_column) == get_split_label(split_type)
+
+
+def read_pixel_table(path, split_type: SplitType = None, columns=None):
+    # the returned arrow table converts to pandas with to_pandas() and its
+    # float32 columns to numpy without copies
+    return open_pixel_table(path).to_table(
+        columns=columns, filter=_get_split_filter(split_type)
+    )
+
+
+def iter_pixel_table_batches(
+    path, split_type: SplitType = None, columns=None, batch_size=2 ** 20
+):
+    # streams record batches, e.g. for predictions or residual analysis
+    # over tables which do not fit into memory
+    return open_pixel_table(path).to_batches(
+        columns=columns,
+        filter=_get_split_filter(split_type),
+        batch_size=batch_size,
+    )
+
+
+def get_X_y_from_pixel_table(path, split_type: SplitType, data_feature):
+    dataset = open_pixel_table(path)
+    feature_columns = get_feature_columns(dataset, data_feature)
+    table = dataset.to_table(
+        columns=feature_columns + ['depth'],
+        filter=_get_split_filter(split_type),
+    )
+
+    X = np.empty((table.num_rows, len(feature_columns)), dtype=np.float32)
+    for band, column in enumerate(feature_columns):
+        X[:, band] = table.column(column).to_numpy()
+    y = table.column('depth').to_numpy()
+
+    return X, y
@@ -1,16 +1,336 @@
+from collections import namedtuple
+
 import numpy as np
+from eolearn.core import EOTask, FeatureType
+
+import eolearn_extras as eolx
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+# number of pixels handled at once by the numpy fallback, bounds the size of
+# the scratch buffer needed for the green band
+_chunk_size = 2 ** 16
+
+
+if numba is not None:
+
+    # factor converts digital numbers to reflectances, it is 1 for features
+    # which already hold reflectances - the band values pass through out so
+    # that integer digital numbers are converted to the output precision
+    # before the division instead of being promoted to float64
+    @numba.njit(parallel=True, cache=True)
+    def _log_ratio_pixels(
+        blue, green, pixel_indices, n, eps_bias, factor, out
+    ):
+        width = blue.shape[1]
+        for i in numba.prange(pixel_indices.shape[0]):
+            row = pixel_indices[i] // width
+            col = pixel_indices[i] % width
+            out[i] = green[row, col]
+            green_value = out[i] / factor + eps_bias
+            out[i] = blue[row, col]
+            out[i] = np.log(n * (out[i] / factor + eps_bias)) / np.log(
+                n * green_value
+            )
+
+    @numba.njit(parallel=True, cache=True)
+    def _log_ratio_raster(blue, green, n, eps_bias, factor, out):
+        height, width = blue.shape
+        for row in numba.prange(height):
+            for col in range(width):
+                out[row, col] = green[row, col]
+                green_value = out[row, col] / factor + eps_bias
+                out[row, col] = blue[row, col]
+                out[row, col] = np.log(
+                    n * (out[row, col] / factor + eps_bias)
+                ) / np.log(n * green_value)
+
+
+def _add_bias(band, eps_bias, dn_reflectance_factor, out):
+    if dn_reflectance_factor is None:
+        np.add(band, eps_bias, out=out)
+    else:
+        eolx.raster.dn_to_reflectance(band, dn_reflectance_factor, out=out)
+        out += eps_bias
+
+
+def _log_ratio_inplace(
+    blue, green, n, eps_bias, dn_reflectance_factor, out, scratch
+):
+    # out and scratch are chunk sized float32 buffers, every step is done in
+    # place so no further temporaries are created
+    _add_bias(blue, eps_bias, dn_reflectance_factor, out)
+    out *= n
+    np.log(out, out=out)
+
+    _add_bias(green, eps_bias, dn_reflectance_factor, scratch)
+    scratch *= n
+    np.log(scratch, out=scratch)
+
+    np.divide(out, scratch, out=out)
+
+
+def _get_blue_green(eopatch, feature):
+    data = eopatch[feature]
+    frame = data[0] if data.ndim == 4 else data
+
+    return (
+        frame[:, :, 1],
+        frame[:, :, 2],
+        eolx.raster.get_dn_reflectance_factor(eopatch, feature),
+    )
+
+
+def compute_stumpf_log_ratio(
+    blue,
+    green,
+    pixel_indices=None,
+    n=10000,
+    eps_bias=0.0000000000001,
+    out=None,
+    use_numba=True,
+    dn_reflectance_factor=None,
+):
+    # without pixel_indices the ratio is computed for the whole (height,
+    # width) raster, otherwise only for the given flat pixel indices
+    out_shape = blue.shape if pixel_indices is None else (len(pixel_indices),)
+    if out is None:
+        out = np.empty(out_shape, dtype=np.float32)
+    elif out.shape != out_shape:
+        raise ValueError(
+            f"Output buffer has shape {out.shape} but {out_shape} is required"
+        )
+
+    if use_numba and numba is not None:
+        # keeping the constants in the output precision lets the kernels
+        # run on single precision logarithms like the numpy code path
+        n = out.dtype.type(n)
+        eps_bias = out.dtype.type(eps_bias)
+        factor = out.dtype.type(
+            1 if dn_reflectance_factor is None else dn_reflectance_factor
+        )
+        if pixel_indices is None:
+            _log_ratio_raster(blue, green, n, eps_bias, factor, out)
+        else:
+            _log_ratio_pixels(
+                blue, green, pixel_indices, n, eps_bias, factor, out
+            )
+
+        return out
+
+    scratch = np.empty(_chunk_size, dtype=out.dtype)
+    if pixel_indices is None:
+        rows_per_chunk = max(1, _chunk_size // blue.shape[1])
+        for row in range(0, blue.shape[0], rows_per_chunk):
+            out_rows = out[row:row + rows_per_chunk]
+            _log_ratio_inplace(
+                blue[row:row + rows_per_chunk],
+                green[row:row + rows_per_chunk],
+                n,
+                eps_bias,
+                dn_reflectance_factor,
+                out_rows,
+                scratch[:out_rows.size].reshape(out_rows.shape),
+            )
+    else:
+        for start in range(0, len(pixel_indices), _chunk_size):
+            chunk_indices = pixel_indices[start:start + _chunk_size]
+            rows, cols = np.unravel_index(chunk_indices, blue.shape)
+            _log_ratio_inplace(
+                blue[rows, cols],
+                green[rows, cols],
+                n,
+                eps_bias,
+                dn_reflectance_factor,
+                out[start:start + len(chunk_indices)],
+                scratch[:len(chunk_indices)],
+            )
+
+    return out
 
 
 # Code inspiration for Stumpf Log-Ratio SDB taken from
 # https://github.com/balajiceg/NearShoreBathymetryPlugin/blob/master/process.py
-def get_stumpf_log_ratio(eopatch, feature, data_mask, n=10000, eps_bias=0.0000000000001):
-    # apply very small bias to not divide by zero
-    blue_band = eopatch[feature][0,:,:,1][data_mask == 1] + eps_bias
-    green_band = eopatch[feature][0,:,:,2][data_mask == 1] + eps_bias
+def get_stumpf_log_ratio(
+    eopatch,
+    feature,
+    data_mask,
+    n=10000,
+    eps_bias=0.0000000000001,
+    out=None,
+    use_numba=True,
+):
+    # a very small bias is applied to not divide by zero
+    blue_band, green_band, dn_reflectance_factor = _get_blue_green(
+        eopatch, feature
+    )
 
     # in stumpf log-ratio this would correspond to z (or rel_z) before applying the constant factor c and the intercept m_0
     # we can get to these values by fitting a linear regression
-    X = np.log(n * blue_band) / np.log(n * green_band)
-    X = X.reshape(-1, 1)
+    X = compute_stumpf_log_ratio(
+        blue_band,
+        green_band,
+        pixel_indices=np.flatnonzero(data_mask == 1),
+        n=n,
+        eps_bias=eps_bias,
+        out=None if out is None else out.reshape(-1),
+        use_numba=use_numba,
+        dn_reflectance_factor=dn_reflectance_factor,
+    )
+
+    return X.reshape(-1, 1)
+
+
+# sufficient statistics of the one feature linear regression, the sum of the
+# squared labels is kept in addition to compute R² and RMSE
+stumpf_statistics_names = ("n", "sum_x", "sum_y", "sum_xx", "sum_xy", "sum_yy")
+
+
+class StumpfCalibration(
+    namedtuple("StumpfCalibration", ["m1", "m0", "r2", "rmse", "n"])
+):
+    def predict(self, X):
+        # accepts the log ratio column alone or with a leading constant as
+        # passed to the statsmodels regression
+        X = np.asarray(X)
+        return self.m1 * X[:, -1] + self.m0
+
+
+def get_stumpf_statistics(
+    eopatch,
+    feature,
+    data_mask,
+    label_feature=(FeatureType.DATA_TIMELESS, "bathy_data"),
+    block_size=2 ** 20,
+    n=10000,
+    eps_bias=0.0000000000001,
+    use_numba=True,
+):
+    blue_band, green_band, dn_reflectance_factor = _get_blue_green(
+        eopatch, feature
+    )
+    labels = eopatch[label_feature][:, :, 0]
+    pixel_indices = np.flatnonzero(data_mask == 1)
+
+    statistics = np.zeros(len(stumpf_statistics_names), dtype=np.float64)
+    ratio_buffer = np.empty(
+        min(block_size, len(pixel_indices)), dtype=np.float32
+    )
+    for start in range(0, len(pixel_indices), block_size):
+        block_indices = pixel_indices[start:start + block_size]
+        x = compute_stumpf_log_ratio(
+            blue_band,
+            green_band,
+            pixel_indices=block_indices,
+            n=n,
+            eps_bias=eps_bias,
+            out=ratio_buffer[:len(block_indices)],
+            use_numba=use_numba,
+            dn_reflectance_factor=dn_reflectance_factor,
+        ).astype(np.float64)
+        y = labels[np.unravel_index(block_indices, labels.shape)].astype(
+            np.float64
+        )
+
+        # pixels with non positive reflectances have no defined log ratio
+        valid = np.isfinite(x) & np.isfinite(y)
+        if not np.all(valid):
+            x, y = x[valid], y[valid]
+
+        statistics += (
+            len(x),
+            x.sum(),
+            y.sum(),
+            np.dot(x, x),
+            np.dot(x, y),
+            np.dot(y, y),
+        )
+
+    return statistics
+
+
+def solve_stumpf_calibrations(statistics):
+    # all regressions are solved at once from the stacked statistics, keys
+    # are usually (aoi, product) tuples
+    keys = list(statistics)
+    (count, sum_x, sum_y, sum_xx, sum_xy, sum_yy) = np.stack(
+        [statistics[key] for key in keys], axis=-1
+    )
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        m1 = (count * sum_xy - sum_x * sum_y) / (count * sum_xx - sum_x ** 2)
+        m0 = (sum_y - m1 * sum_x) / count
+
+        sse = (
+            sum_yy
+            - 2 * m0 * sum_y
+            - 2 * m1 * sum_xy
+            + count * m0 ** 2
+            + 2 * m0 * m1 * sum_x
+            + m1 ** 2 * sum_xx
+        )
+        sst = sum_yy - sum_y ** 2 / count
+        sse = np.maximum(sse, 0)
+
+        r2 = 1 - sse / sst
+        rmse = np.sqrt(sse / count)
+
+    return dict(
+        (key, StumpfCalibration(m1[i], m0[i], r2[i], rmse[i], int(count[i])))
+        for (i, key) in enumerate(keys)
+    )
+
+
+def calibrate_stumpf(calibration_inputs, **statistics_kwargs):
+    # calibration_inputs maps a key to an (eopatch, feature, data_mask) tuple
+    return solve_stumpf_calibrations(
+        dict(
+            (key, get_stumpf_statistics(*inputs, **statistics_kwargs))
+            for (key, inputs) in calibration_inputs.items()
+        )
+    )
+
+
+class AddStumpfLogRatio(EOTask):
+    def __init__(
+        self,
+        feature,
+        output_feature=(FeatureType.DATA_TIMELESS, "stumpf_log_ratio"),
+        data_mask_feature=None,
+        n=10000,
+        eps_bias=0.0000000000001,
+        use_numba=True,
+    ):
+        self.feature = feature
+        self.output_feature = output_feature
+        self.data_mask_feature = data_mask_feature
+        self.n = n
+        self.eps_bias = eps_bias
+        self.use_numba = use_numba
+
+    def execute(self, eopatch):
+        blue_band, green_band, dn_reflectance_factor = _get_blue_green(
+            eopatch, self.feature
+        )
+
+        relative_depth = np.empty(blue_band.shape + (1,), dtype=np.float32)
+        compute_stumpf_log_ratio(
+            blue_band,
+            green_band,
+            n=self.n,
+            eps_bias=self.eps_bias,
+            out=relative_depth[:, :, 0],
+            use_numba=self.use_numba,
+            dn_reflectance_factor=dn_reflectance_factor,
+        )
+        if self.data_mask_feature is not None:
+            relative_depth[eopatch[self.data_mask_feature] != 1] = np.nan
+
+        result_eop = eopatch.copy()
+        result_eop[self.output_feature] = relative_depth
 
-    return X
+        return result_eop
@@ -0,0 +1,231 @@
+import os
+import json
+import time
+import datetime
+import traceback
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import optuna
+import optuna.integration.lightgbm as lgb
+from lightgbm import early_stopping
+
+from sdb_utils.ml_utils import create_train_val_set
+
+
+TuningJob = namedtuple('TuningJob', ['name', 'eop', 'data_feature'])
+
+
+def build_tuning_jobs(eops, data_features):
+    # eops maps an AOI name to its train/test EOPatch, every AOI is tuned
+    # for every product feature, e.g. {aoi}/L1C_data
+    return [
+        TuningJob(f'{aoi_name}/{data_feature[1]}', eop, data_feature)
+        for (aoi_name, eop) in eops.items()
+        for data_feature in data_features
+    ]
+
+
+def get_thread_budget(total_threads, job_count, max_concurrent_jobs=None):
+    # returns the number of concurrently tuned jobs and the LightGBM threads
+    # of every job, so that together they do not oversubscribe the cores
+    total_threads = os.cpu_count() if total_threads is None else total_threads
+    concurrent_jobs = min(
+        job_count,
+        total_threads,
+        job_count if max_concurrent_jobs is None else max_concurrent_jobs,
+    )
+    concurrent_jobs = max(1, concurrent_jobs)
+
+    return concurrent_jobs, max(1, total_threads // concurrent_jobs)
+
+
+class JobLog:
+    # one JSON object per line and event, a job keeps appending to its log
+    # when an interrupted run is resumed
+    def __init__(self, log_path):
+        self.log_path = os.path.abspath(log_path)
+        os.makedirs(os.path.dirname(self.log_path), exist_ok=True)
+
+    def write(self, event, **values):
+        entry = dict(
+            time=datetime.datetime.now().isoformat(), event=event, **values
+        )
+        with open(self.log_path, 'a') as f:
+            f.write(json.dumps(entry, default=str) + '\n')
+
+    def read(self):
+        if not os.path.isfile(self.log_path):
+            return []
+
+        with open(self.log_path) as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+
+def log_evaluation_to_job_log(job_log: JobLog, period=100):
+    # replaces lightgbm.log_evaluation, concurrent jobs would otherwise
+    # interleave their output on the shared stdout
+    def _callback(env):
+        if period > 0 and (env.iteration + 1) % period == 0:
+            job_log.write(
+                'evaluation',
+                iteration=env.iteration + 1,
+                results=[
+                    [data_name, eval_name, result]
+                    for (data_name, eval_name, result, *_)
+                    in env.evaluation_result_list
+                ],
+            )
+
+    return _callback
+
+
+def log_trial_to_job_log(job_log: JobLog):
+    def _callback(study, trial):
+        job_log.write(
+            'trial',
+            number=trial.number,
+            step=trial.system_attrs.get('lightgbm_tuner:step_name'),
+            state=trial.state.name,
+            value=trial.value,
+            params=trial.params,
+        )
+
+    return _callback
+
+
+def get_optuna_storage(storage_path):
+    # a local SQLite file shared by all jobs, each job owns one study, the
+    # timeout lets concurrent jobs wait for the database lock
+    return optuna.storages.RDBStorage(
+        f'sqlite:///{os.path.abspath(storage_path)}',
+        engine_kwargs={'connect_args': {'timeout': 60}},
+    )
+
+
+def tune_job(
+    job: TuningJob,
+    params,
+    output_dir,
+    storage,
+    num_threads,
+    dataset_cache_dir=None,
+    early_stopping_rounds=100,
+    log_period=100,
+    optuna_seed=42,
+    train_sample_name=None,
+):
+    job_dir = os.path.join(output_dir, job.name)
+    job_log = JobLog(os.path.join(job_dir, 'log.jsonl'))
+    start_time = time.perf_counter()
+    job_log.write(
+        'started', data_feature=job.data_feature[1], num_threads=num_threads
+    )
+
+    train_ds, val_ds = create_train_val_set(
+        job.eop,
+        job.data_feature,
+        cache_dir=dataset_cache_dir,
+        train_sample_name=train_sample_name,
+    )
+
+    # the study is resumed from the storage when it already exists, the
+    # boosters of finished trials are needed to return the best one then
+    study = optuna.create_study(
+        study_name=job.name,
+        storage=storage,
+        direction='minimize',
+        load_if_exists=True,
+    )
+    tuner = lgb.LightGBMTuner(
+        dict(params, num_threads=num_threads, verbosity=-1),
+        train_ds,
+        valid_sets=val_ds,
+        callbacks=[
+            early_stopping(early_stopping_rounds, verbose=False),
+            log_evaluation_to_job_log(job_log, log_period),
+        ],
+        study=study,
+        optuna_callbacks=[log_trial_to_job_log(job_log)],
+        model_dir=os.path.join(job_dir, 'boosters'),
+        show_progress_bar=False,
+        optuna_seed=optuna_seed,
+    )
+    tuner.run()
+
+    model = tuner.get_best_booster()
+    model.save_model(os.path.join(job_dir, 'model.txt'))
+    job_log.write(
+        'finished',
+        best_score=tuner.best_score,
+        best_params=tuner.best_params,
+        trials=len(study.trials),
+        elapsed=time.perf_counter() - start_time,
+    )
+
+    return model
+
+
+def run_tuning_jobs(
+    jobs,
+    params,
+    output_dir,
+    storage_path=None,
+    total_threads=None,
+    max_concurrent_jobs=None,
+    dataset_cache_dir=None,
+    early_stopping_rounds=100,
+    log_period=100,
+    optuna_seed=42,
+    train_sample_name=None,
+    log_callback=None,
+):
+    # LightGBM releases the GIL while boosting, so the jobs run in threads
+    # and share the EOPatches without copying them into worker processes
+    output_dir = os.path.abspath(output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    storage = get_optuna_storage(
+        os.path.join(output_dir, 'optuna.db') if storage_path is None
+        else storage_path
+    )
+    concurrent_jobs, num_threads = get_thread_budget(
+        total_threads, len(jobs), max_concurrent_jobs
+    )
+    if log_callback:
+        log_callback(
+            f'Tuning {len(jobs)} jobs, {concurrent_jobs} at a time with '
+            f'{num_threads} threads each.'
+        )
+
+    def run_job(job):
+        try:
+            model = tune_job(
+                job,
+                params,
+                output_dir,
+                storage,
+                num_threads,
+                dataset_cache_dir=dataset_cache_dir,
+                early_stopping_rounds=early_stopping_rounds,
+                log_period=log_period,
+                optuna_seed=optuna_seed,
+                train_sample_name=train_sample_name,
+            )
+        except Exception as e:
+            JobLog(os.path.join(output_dir, job.name, 'log.jsonl')).write(
+                'failed', error=repr(e), traceback=traceback.format_exc()
+            )
+            if log_callback:
+                log_callback(f'Tuning {job.name} failed: {e!r}')
+            return None
+
+        if log_callback:
+            log_callback(f'Tuned {job.name}.')
+
+        return model
+
+    with ThreadPoolExecutor(max_workers=concurrent_jobs) as executor:
+        models = list(executor.map(run_job, jobs))
+
+    # failed jobs map to None, running again resumes their studies
+    return dict((job.name, model) for (job, model) in zip(jobs, models))
@@ -0,0 +1,42 @@
+import os
+import sys
+
+# eo-learn saves features with fs.move without importing the submodule
+import fs.move  # noqa: F401
+import numpy as np
+import pytest
+from eolearn.core import EOPatch, FeatureType
+
+# the notebook helpers are imported as sdb_utils like in the notebooks
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.dirname(__file__)), "notebooks")
+)
+
+import eolearn_extras as eolx  # noqa: E402
+
+
+def _make_split_eopatch(split_count=3, height=40, width=50, seed=0):
+    # a small train/test EOPatch whose bands depend on the depth, rows at
+    # the top are land without depth
+    rng = np.random.default_rng(seed)
+    eop = EOPatch()
+    depth = -rng.random((height, width, 1)).astype(np.float32) * 20
+    depth[:5] = 5
+    eop.data_timeless["bathy_data"] = depth
+    eop.mask_timeless["bathy_data_mask"] = (depth < 0).astype(np.uint8)
+    bands = rng.random((1, height, width, 13)).astype(np.float32) * 0.01
+    bands[..., 1:4] += np.exp(depth / 10)[np.newaxis] * [0.3, 0.2, 0.1]
+    eop.data["L1C_data"] = bands
+    eop.mask_timeless["train_test_split"] = rng.integers(
+        1, split_count + 1, (height, width, 1)
+    ).astype(np.uint8)
+
+    return eolx.ml_util.AddValidTrainTestMasks(
+        (FeatureType.MASK_TIMELESS, "train_test_split"),
+        (FeatureType.MASK_TIMELESS, "bathy_data_mask"),
+    ).execute(eop)
+
+
+@pytest.fixture
+def make_split_eopatch():
+    return _make_split_eopatch
@@ -0,0 +1,61 @@
+import datetime
+
+import numpy as np
+import rasterio as rio
+from rasterio.transform import from_origin
+
+from eolearn_extras.catalog import SceneCatalog, extract_acolite_meta_from_path
+from sdb_utils.paths import return_product_paths_for_dt_from_catalog
+
+
+def write_band(path, bounds=(500000, 2000000, 500200, 2000200)):
+    min_x, _, max_x, max_y = bounds
+    with rio.open(
+        path,
+        "w",
+        driver="GTiff",
+        width=20,
+        height=20,
+        count=1,
+        dtype="float32",
+        crs="EPSG:32619",
+        transform=from_origin(min_x, max_y, (max_x - min_x) / 20, 10),
+    ) as dst:
+        dst.write(np.zeros((1, 20, 20), dtype=np.float32))
+
+
+def test_extract_acolite_meta_from_path():
+    assert extract_acolite_meta_from_path(
+        "/archive/S2B_MSI_20210502T150719_ACOLITE_SUBSET"
+    ) == ("S2B", "ACOLITE", datetime.datetime(2021, 5, 2, 15, 7, 19))
+
+
+def test_index_directory_with_acolite_folders(tmp_path):
+    acq_time = datetime.datetime(2021, 5, 2, 15, 7, 19)
+    acolite_path = tmp_path / "S2B_MSI_20210502T150719_ACOLITE_SUBSET"
+    acolite_path.mkdir()
+    write_band(acolite_path / "S2B_MSI_2021_05_02_15_07_19_L2R_rhos_492.tif")
+    for level in ("L1C", "L2A"):
+        product_path = (
+            tmp_path
+            / f"S2B_MSI{level}_20210502T150719_N0300_R082_T19QHA_"
+            "20210502T180000.SAFE"
+        )
+        product_path.mkdir()
+        write_band(product_path / "B02.jp2")
+
+    catalog = SceneCatalog(tmp_path / "catalog.db")
+    scenes = catalog.index_directory(tmp_path)
+
+    assert len(scenes) == 3
+    acolite_scene = catalog.get_scene(acolite_path)
+    assert acolite_scene.level == "ACOLITE"
+    assert acolite_scene.acq_time == acq_time
+    assert acolite_scene.crs == 32619
+
+    (_, _, found_acolite_path) = return_product_paths_for_dt_from_catalog(
+        catalog, acq_time
+    )
+    assert found_acolite_path == str(acolite_path)
+    # indexing again only opens new products
+    assert catalog.index_directory(tmp_path) == []
@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from sdb_utils.evaluation import ModelEvaluation, get_performance
+
+
+class LinearModel:
+    def __init__(self, coefficients):
+        self.coefficients = np.asarray(coefficients)
+
+    def predict(self, X):
+        return np.asarray(X) @ self.coefficients
+
+
+def test_get_performance():
+    y = np.array([1.0, 2.0, 3.0, 4.0])
+    y_hat = np.array([1.5, 2.0, 2.0, 4.0])
+    performance = get_performance(y, y_hat)
+
+    # residuals are 0.5, 0, -1 and 0 around a mean of 2.5
+    assert performance["mse"] == pytest.approx(1.25 / 4)
+    assert performance["rmse"] == pytest.approx(np.sqrt(1.25 / 4))
+    assert performance["r2"] == pytest.approx(1 - 1.25 / 5)
+    assert performance["mae"] == pytest.approx(1.5 / 4)
+    assert performance["mad"] == pytest.approx(0.25)
+
+
+def test_get_performance_matches_sklearn():
+    metrics = pytest.importorskip("sklearn.metrics")
+    rng = np.random.default_rng(0)
+    y = rng.normal(size=1000).astype(np.float32)
+    y_hat = y + rng.normal(scale=0.3, size=1000).astype(np.float32)
+    performance = get_performance(y, y_hat)
+
+    assert performance["mse"] == pytest.approx(
+        metrics.mean_squared_error(y, y_hat), rel=1e-5
+    )
+    assert performance["r2"] == pytest.approx(
+        metrics.r2_score(y, y_hat), rel=1e-5
+    )
+    assert performance["mae"] == pytest.approx(
+        metrics.mean_absolute_error(y, y_hat), rel=1e-5
+    )
+    assert performance["mad"] == pytest.approx(
+        metrics.median_absolute_error(y, y_hat), rel=1e-5
+    )
+
+
+def test_depth_binned_errors_include_the_top_edge():
+    y = np.array([-10.0, -5.0, -2.0, 0.0, 1.0])
+    evaluation = ModelEvaluation(
+        None, None, y, predictions=y + np.array([1, 1, 2, 2, 5])
+    )
+    errors = evaluation.depth_binned_errors([-10, -5, 0])
+
+    # -5 opens the second bin and 0 closes it, 1 is outside of the bins
+    assert errors["count"].tolist() == [1, 3]
+    assert errors["bias"].tolist() == pytest.approx([1, 5 / 3])
+
+
+def test_permutation_importance_orders_variables():
+    rng = np.random.default_rng(0)
+    X = pd.DataFrame(
+        rng.normal(size=(2000, 3)), columns=["blue", "green", "red"]
+    )
+    y = X["blue"] * 3 + X["green"] * 0.5
+    evaluation = ModelEvaluation(
+        LinearModel([3, 0.5, 0]), X, y, label="linear", max_workers=1
+    )
+    importance = evaluation.permutation_importance(
+        n_permutations=3, sample_size=500, batch_size=1000
+    )
+
+    assert importance["variable"].tolist() == [
+        "_full_model_",
+        "_baseline_",
+        "blue",
+        "green",
+        "red",
+    ]
+    losses = importance.set_index("variable")["dropout_loss"]
+    # predictions are float32
+    assert losses["_full_model_"] == pytest.approx(0, abs=1e-6)
+    assert losses["red"] == pytest.approx(0, abs=1e-6)
+    assert losses["blue"] > losses["green"] > 0
+
+
+def test_permutation_importance_feature_names():
+    X = np.random.default_rng(0).normal(size=(100, 2))
+    evaluation = ModelEvaluation(
+        LinearModel([1, 0]), X, X[:, 0], feature_names=["a", "b"]
+    )
+    importance = evaluation.permutation_importance(n_permutations=2)
+
+    assert set(importance["variable"]) == {
+        "_full_model_", "_baseline_", "a", "b"
+    }
@@ -0,0 +1,100 @@
+import os
+import json
+import datetime
+
+import numpy as np
+from eolearn.core import EOPatch, EOTask, FeatureType
+from sentinelhub import BBox, CRS
+
+from eolearn_extras.ingest import IncrementalIngest, load_appended_eopatch
+
+bbox = BBox((600000, 1990000, 600100, 1990100), crs=CRS.UTM_19N)
+
+
+class ReadProductTask(EOTask):
+    # products are small JSON files holding their timestamp and pixel value
+    def execute(self, product_path):
+        with open(product_path) as f:
+            product = json.load(f)
+
+        eopatch = EOPatch()
+        eopatch.bbox = bbox
+        eopatch.timestamp = [datetime.datetime.fromisoformat(product["time"])]
+        eopatch[(FeatureType.DATA, "bands")] = np.full(
+            (1, 10, 10, 2), product["value"], dtype=np.float32
+        )
+        eopatch[(FeatureType.MASK_TIMELESS, "mask")] = np.ones(
+            (10, 10, 1), dtype=np.uint8
+        )
+
+        return eopatch
+
+
+def write_product(path, time, value):
+    with open(path, "w") as f:
+        json.dump({"time": time, "value": value}, f)
+
+    return str(path)
+
+
+def get_file_mtimes(path):
+    return dict(
+        (file_path, os.stat(file_path).st_mtime_ns)
+        for (root, _, files) in os.walk(path)
+        for file_path in [os.path.join(root, name) for name in files]
+    )
+
+
+def test_append_only_writes_new_frames(tmp_path):
+    output_path = tmp_path / "series"
+    products = [
+        write_product(tmp_path / "b.json", "2021-05-12T15:07:19", 2),
+        write_product(tmp_path / "a.json", "2021-05-02T15:07:19", 1),
+    ]
+    IncrementalIngest(ReadProductTask(), output_path, append=True).run(
+        products
+    )
+    existing_mtimes = get_file_mtimes(output_path)
+
+    # a later scene and a second product of an already ingested acquisition
+    products += [
+        write_product(tmp_path / "c.json", "2021-05-22T15:07:19", 3),
+        write_product(tmp_path / "d.json", "2021-05-02T15:07:19", 4),
+    ]
+    ingested = IncrementalIngest(
+        ReadProductTask(), output_path, append=True
+    ).run(products)
+
+    assert ingested == products[2:]
+    assert len(os.listdir(output_path)) == 3
+    current_mtimes = get_file_mtimes(output_path)
+    for path, mtime in existing_mtimes.items():
+        if "20210512T150719" in path:
+            assert current_mtimes[path] == mtime
+
+    eopatch = load_appended_eopatch(output_path)
+    assert eopatch.timestamp == [
+        datetime.datetime(2021, 5, 2, 15, 7, 19),
+        datetime.datetime(2021, 5, 12, 15, 7, 19),
+        datetime.datetime(2021, 5, 22, 15, 7, 19),
+    ]
+    assert eopatch.data["bands"][:, 0, 0, 0].tolist() == [4, 2, 3]
+    assert eopatch.mask_timeless["mask"].shape == (10, 10, 1)
+
+
+def test_changed_product_replaces_its_frame(tmp_path):
+    output_path = tmp_path / "series"
+    product = write_product(tmp_path / "a.json", "2021-05-02T15:07:19", 1)
+    IncrementalIngest(ReadProductTask(), output_path, append=True).run(
+        [product]
+    )
+
+    os.utime(product, ns=(0, 0))
+    write_product(product, "2021-05-03T15:07:19", 5)
+    IncrementalIngest(ReadProductTask(), output_path, append=True).run(
+        [product]
+    )
+
+    eopatch = load_appended_eopatch(output_path)
+    assert eopatch.timestamp == [datetime.datetime(2021, 5, 3, 15, 7, 19)]
+    assert eopatch.data["bands"][0, 0, 0, 0] == 5
@@ -0,0 +1,109 @@
+import dask.array as da
+import eolearn.core
+import numpy as np
+import rasterio as rio
+from eolearn.core import EOPatch, FeatureType
+from rasterio.transform import from_origin
+from sentinelhub import BBox, CRS
+
+from eolearn_extras.io import (
+    LazyFeatureIO,
+    lazy_band_on_grid,
+    make_lazy_feature,
+    read_sentinel_band_for_aois,
+    read_sentinel_band_on_grid,
+)
+
+
+def write_tile(path, size=40, origin=(600000, 1990400)):
+    values = np.random.default_rng(0).integers(
+        1, 10000, (1, size, size), dtype=np.uint16
+    )
+    with rio.open(
+        path,
+        "w",
+        driver="GTiff",
+        width=size,
+        height=size,
+        count=1,
+        dtype="uint16",
+        crs="EPSG:32619",
+        transform=from_origin(*origin, 10, 10),
+    ) as dst:
+        dst.write(values)
+
+    return str(path)
+
+
+def test_read_for_aois_matches_windowed_reads(tmp_path):
+    band_path = write_tile(tmp_path / "B02.tif")
+    aois = [
+        # pixel aligned and inside the tile
+        (BBox((600050, 1990050, 600250, 1990250), crs=CRS.UTM_19N), (20, 20)),
+        # warped and extending past the eastern and southern tile border
+        (BBox((600205, 1989905, 600505, 1990205), crs=CRS.UTM_19N), (15, 15)),
+    ]
+
+    aoi_values, _ = read_sentinel_band_for_aois(
+        band_path, aois, driver="GTiff"
+    )
+
+    for (bbox, shape), values in zip(aois, aoi_values):
+        expected = read_sentinel_band_on_grid(
+            band_path, bbox, shape, driver="GTiff"
+        ).values[0]
+        np.testing.assert_array_equal(values, expected)
+    # pixels outside of the tile are nodata like in the windowed reads
+    assert aoi_values[1][-1, -1] == 65535
+
+
+def test_lazy_band_matches_eager_read(tmp_path):
+    band_path = write_tile(tmp_path / "B02.tif", size=120)
+    # warped onto the neighbouring UTM zone at a coarser resolution
+    bbox = BBox(
+        (600103, 1989307, 601003, 1990207), crs=CRS.UTM_19N
+    ).transform(CRS.UTM_20N)
+    shape = (70, 66)
+
+    for chunks, block_size in [(16, 1024), (20, 32)]:
+        expected = read_sentinel_band_on_grid(
+            band_path, bbox, shape, driver="GTiff", block_size=block_size
+        )
+        lazy_values = lazy_band_on_grid(
+            band_path,
+            bbox,
+            shape,
+            chunks=chunks,
+            driver="GTiff",
+            block_size=block_size,
+        )
+
+        assert lazy_values.chunksize == (chunks, chunks)
+        np.testing.assert_array_equal(lazy_values.compute(), expected[0])
+        assert expected.rio.transform() == rio.transform.from_bounds(
+            *bbox, shape[1], shape[0]
+        )
+
+
+def test_lazy_features_are_computed_on_save(tmp_path, monkeypatch):
+    values = np.arange(24, dtype=np.uint16).reshape(1, 3, 4, 2)
+    eopatch = EOPatch()
+    eopatch[FeatureType.DATA, "bands"] = make_lazy_feature(
+        FeatureType.DATA, da.from_array(values, chunks=2)
+    )
+    assert isinstance(
+        eopatch.data.__getitem__("bands", load=False), LazyFeatureIO
+    )
+
+    eopatch.save(str(tmp_path / "eop"))
+
+    np.testing.assert_array_equal(
+        EOPatch.load(str(tmp_path / "eop")).data["bands"], values
+    )
+
+    monkeypatch.setattr(eolearn.core, "__version__", "1.1.0")
+    computed = make_lazy_feature(
+        FeatureType.DATA, da.from_array(values, chunks=2)
+    )
+    assert isinstance(computed, np.ndarray)
+    np.testing.assert_array_equal(computed, values)
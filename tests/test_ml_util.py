@@ -0,0 +1,58 @@
+import numpy as np
+
+from eolearn_extras.ml_util import (
+    get_split_indices_feature,
+    get_split_label_values,
+    sample_depth_stratified_pixels,
+)
+from sdb_utils.ml_utils import get_split_mask, split_names
+
+
+def test_top_depth_bin_includes_its_upper_edge():
+    depth = np.array([[0.0, 1.0, 2.0, 5.0, 10.0, 12.0]], dtype=np.float32)
+    sample, stratum_sizes = sample_depth_stratified_pixels(
+        np.arange(depth.size), depth, [0, 5, 10], target_size=10
+    )
+
+    assert sample.tolist() == [0, 1, 2, 3, 4]
+    assert stratum_sizes.tolist() == [3, 2]
+
+
+def test_thinning_keeps_one_pixel_per_cell():
+    depth = np.full((8, 9), 1.0, dtype=np.float32)
+    sample, _ = sample_depth_stratified_pixels(
+        np.arange(depth.size),
+        depth,
+        [0, 5],
+        target_size=depth.size,
+        thinning_distance=3,
+        block_size=9,
+    )
+    rows, cols = np.divmod(sample, depth.shape[1])
+    cells = list(zip(rows // 3, cols // 3))
+
+    assert len(cells) == len(set(cells)) == 9
+
+
+def test_split_labels_replace_the_split_masks(make_split_eopatch):
+    eop = make_split_eopatch(split_count=3)
+
+    assert "train_split_valid" not in eop.mask_timeless
+    label_values = get_split_label_values(eop)
+    assert label_values == {"train": 1, "test": 2, "validation": 3}
+    for split_type, split_name in split_names.items():
+        split_mask = get_split_mask(eop, split_type)
+        assert np.array_equal(
+            np.flatnonzero(split_mask),
+            eop[get_split_indices_feature(split_name)],
+        )
+        assert np.all(
+            eop.mask_timeless["split_labels"][split_mask]
+            == label_values[split_name]
+        )
+        # TrainTestSplitTask marks the validation split with 2 and the test
+        # split with 3 in three way splits
+        raw_marker = {"train": 1, "validation": 2, "test": 3}[split_name]
+        assert np.all(
+            eop.mask_timeless["train_test_split"][split_mask] == raw_marker
+        )
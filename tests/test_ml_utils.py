@@ -0,0 +1,75 @@
+import os
+import warnings
+
+from eolearn.core import FeatureType
+
+with warnings.catch_warnings():
+    warnings.simplefilter("ignore", FutureWarning)
+    import optuna
+    import optuna.integration.lightgbm as lgb
+
+from sdb_utils.ml_utils import (
+    PixelFeatureExtractor,
+    create_train_val_set,
+    get_train_val_set_cache_key,
+)
+
+data_feature = (FeatureType.DATA, "L1C_data")
+params = {
+    "objective": "regression",
+    "metric": "rmse",
+    "verbosity": -1,
+    "num_threads": 1,
+    "num_iterations": 5,
+}
+
+
+def tune(train_ds, val_ds):
+    optuna.logging.set_verbosity(optuna.logging.WARNING)
+    tuner = lgb.LightGBMTuner(
+        params,
+        train_ds,
+        valid_sets=val_ds,
+        show_progress_bar=False,
+        time_budget=2,
+        optuna_seed=0,
+    )
+    tuner.run()
+
+    return tuner.get_best_booster()
+
+
+def test_cached_train_val_set_can_be_tuned(tmp_path, make_split_eopatch):
+    eop = make_split_eopatch()
+    cache_dir = tmp_path / "dataset_cache"
+
+    # the first call builds and saves the binaries, the second loads them
+    for cached_keys in (0, 1):
+        assert len(os.listdir(cache_dir) if cache_dir.is_dir() else []) == (
+            cached_keys
+        )
+        train_ds, val_ds = create_train_val_set(
+            eop, data_feature, cache_dir=cache_dir
+        )
+
+        assert tune(train_ds, val_ds).num_trees() > 0
+        assert len(os.listdir(cache_dir)) == 1
+
+
+def test_cache_key_covers_every_pixel(make_split_eopatch):
+    eop = make_split_eopatch()
+    dataset_params = {"feature_pre_filter": False}
+    key = get_train_val_set_cache_key(
+        PixelFeatureExtractor(eop), data_feature, dataset_params
+    )
+
+    eop[data_feature][0, 1, 1, 0] += 1
+    changed_key = get_train_val_set_cache_key(
+        PixelFeatureExtractor(eop), data_feature, dataset_params
+    )
+    eop[(FeatureType.DATA_TIMELESS, "bathy_data")][30, 40, 0] -= 1
+    relabelled_key = get_train_val_set_cache_key(
+        PixelFeatureExtractor(eop), data_feature, dataset_params
+    )
+
+    assert len({key, changed_key, relabelled_key}) == 3
@@ -0,0 +1,62 @@
+import os
+
+import numpy as np
+import pytest
+from eolearn.core import FeatureType
+
+import eolearn_extras as eolx
+from sdb_utils.ml_utils import SplitType, gather_pixels
+from sdb_utils.pixel_table import (
+    export_pixel_table,
+    get_X_y_from_pixel_table,
+    read_pixel_table,
+)
+
+pytest.importorskip("pyarrow")
+
+data_feature = (FeatureType.DATA, "L1C_data")
+
+
+def test_export_pixel_table_replaces_stale_partitions(
+    tmp_path, make_split_eopatch
+):
+    output_path = str(tmp_path / "pixels")
+    export_pixel_table(make_split_eopatch(3), output_path, [data_feature])
+    assert "split_label=3" in os.listdir(output_path)
+
+    eop = make_split_eopatch(2, seed=1)
+    with pytest.raises(FileExistsError):
+        export_pixel_table(eop, output_path, [data_feature])
+
+    export_pixel_table(eop, output_path, [data_feature], overwrite=True)
+
+    assert "split_label=3" not in os.listdir(output_path)
+    assert read_pixel_table(output_path).num_rows == np.sum(
+        eop.mask_timeless["bathy_data_mask"]
+    )
+    X, _ = get_X_y_from_pixel_table(output_path, SplitType.Train, data_feature)
+    assert len(X) == len(
+        eop[eolx.ml_util.get_split_indices_feature("train")]
+    )
+
+
+def test_export_pixel_table_refuses_foreign_folders(
+    tmp_path, make_split_eopatch
+):
+    (tmp_path / "notes.txt").write_text("")
+    with pytest.raises(FileExistsError):
+        export_pixel_table(
+            make_split_eopatch(2),
+            str(tmp_path),
+            [data_feature],
+            overwrite=True,
+        )
+    assert os.listdir(tmp_path) == ["notes.txt"]
+
+
+def test_gather_pixels_rejects_out_of_range_indices():
+    data = np.zeros((1, 4, 5, 2), dtype=np.float32)
+    with pytest.raises(IndexError):
+        gather_pixels(data, np.array([0, 20]))
+    with pytest.raises(IndexError):
+        gather_pixels(data[..., ::-1], np.array([-1]))
@@ -0,0 +1,66 @@
+import os
+import warnings
+
+from eolearn.core import FeatureType
+
+with warnings.catch_warnings():
+    warnings.simplefilter("ignore", FutureWarning)
+    from sdb_utils.training import JobLog, build_tuning_jobs, run_tuning_jobs
+
+params = {
+    "objective": "regression",
+    "metric": "rmse",
+    "verbosity": -1,
+    "num_iterations": 3,
+}
+
+
+def get_events(output_dir, job_name):
+    return [
+        entry["event"]
+        for entry in JobLog(
+            os.path.join(output_dir, job_name, "log.jsonl")
+        ).read()
+    ]
+
+
+def test_run_tuning_jobs_resumes_studies(tmp_path, make_split_eopatch):
+    jobs = build_tuning_jobs(
+        {
+            "aoi_a": make_split_eopatch(height=30, width=30),
+            "aoi_b": make_split_eopatch(height=30, width=30, seed=1),
+        },
+        [(FeatureType.DATA, "L1C_data")],
+    )
+    output_dir = tmp_path / "tuning"
+    run_kwargs = dict(
+        output_dir=output_dir,
+        total_threads=2,
+        dataset_cache_dir=tmp_path / "dataset_cache",
+        early_stopping_rounds=2,
+        log_period=1,
+    )
+
+    models = run_tuning_jobs(jobs, params, **run_kwargs)
+
+    assert sorted(models) == ["aoi_a/L1C_data", "aoi_b/L1C_data"]
+    assert all(model is not None for model in models.values())
+    assert os.path.isfile(output_dir / "optuna.db")
+    trial_counts = {}
+    for job in jobs:
+        events = get_events(output_dir, job.name)
+        assert events[0] == "started"
+        assert events[-1] == "finished"
+        assert "evaluation" in events
+        trial_counts[job.name] = events.count("trial")
+        assert trial_counts[job.name] > 0
+        assert os.path.isfile(output_dir / job.name / "model.txt")
+
+    # the second run finds the finished studies and adds no trials
+    models = run_tuning_jobs(jobs, params, **run_kwargs)
+
+    assert all(model is not None for model in models.values())
+    for job in jobs:
+        events = get_events(output_dir, job.name)
+        assert events.count("finished") == 2
+        assert events.count("trial") == trial_counts[job.name]